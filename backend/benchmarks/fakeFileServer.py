@@ -0,0 +1,196 @@
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs
+
+
+def format_size(size: int) -> str:
+    """Format a size the way the Node file server does (getSize)."""
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.2f} KB"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f} MB"
+    return f"{size / 1024 / 1024 / 1024:.2f} GB"
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeFileServer:
+    """
+    Local stand-in for file-server/filesystem-server.js serving a directory.
+
+    Speaks the two actions the backend uses:
+    - POST /  {"action": "read", "path": ...}: lists a directory; the response
+      is JSON-encoded twice, like the Node server's res.json(JSON.stringify(...))
+    - POST /Download  (form field downloadInput): a single file is sent as is
+      (with Range support, like express res.download); several names or a
+      directory are sent as a zip, directory entries keeping their structure
+
+    Args:
+        root: Directory served as "/"
+        latency: Seconds added to every request
+        bandwidth: Download throughput in bytes per second (None for unlimited)
+    """
+
+    def __init__(self, root: str, latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = {"read": 0, "download": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeFileServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-file-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _resolve(self, *parts: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, *[p.strip("/") for p in parts if p]))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise ValueError("Access denied for Directory-traversal")
+        return path
+
+    def _item(self, path: str, filter_path: str) -> dict:
+        stats = os.stat(path)
+        is_file = os.path.isfile(path)
+        return {
+            "name": os.path.basename(path),
+            "size": format_size(stats.st_size) if is_file else "0 B",
+            "isFile": is_file,
+            "dateModified": _iso(stats.st_mtime),
+            "dateCreated": _iso(stats.st_ctime),
+            "type": os.path.splitext(path)[1] if is_file else "",
+            "filterPath": filter_path,
+            "hasChild": not is_file and any(os.path.isdir(os.path.join(path, n)) for n in os.listdir(path)),
+        }
+
+    def read(self, path: str) -> dict:
+        directory = self._resolve(path)
+        filter_path = "/" + "/".join(p for p in path.split("/") if p)
+        filter_path = filter_path.rstrip("/") + "/"
+        cwd = self._item(directory, filter_path)
+        files = [self._item(os.path.join(directory, name), filter_path) for name in sorted(os.listdir(directory))]
+        return {"cwd": cwd, "files": files}
+
+    def archive(self, download: dict) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for item in download.get("data", []):
+                source = self._resolve(item.get("filterPath", download.get("path", "/")), item["name"])
+                if os.path.isfile(source):
+                    archive.write(source, item["name"])
+                    continue
+                for dirpath, _, filenames in os.walk(source):
+                    for filename in filenames:
+                        full_path = os.path.join(dirpath, filename)
+                        archive.write(full_path, os.path.join(item["name"], os.path.relpath(full_path, source)))
+        return buffer.getvalue()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if server.bandwidth:
+                    block = max(1, int(server.bandwidth / 20))
+                    for start in range(0, len(body), block):
+                        self.wfile.write(body[start:start + block])
+                        time.sleep(len(body[start:start + block]) / server.bandwidth)
+                else:
+                    self.wfile.write(body)
+
+            def _send_json(self, status: int, payload) -> None:
+                # The Node server stringifies the response and then sends it with res.json
+                self._send(status, json.dumps(json.dumps(payload)).encode("utf-8"), "application/json")
+
+            def do_POST(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                body = self._body()
+                try:
+                    if self.path.rstrip("/") == "/Download":
+                        server._count("download")
+                        form = parse_qs(body.decode("utf-8"))
+                        self._download(json.loads(form["downloadInput"][0]))
+                    else:
+                        server._count("read")
+                        request = json.loads(body or b"{}")
+                        if request.get("action") != "read":
+                            self._send_json(400, {"error": {"code": "400", "message": "Unsupported action"}})
+                            return
+                        self._send_json(200, server.read(request.get("path", "/")))
+                except FileNotFoundError as e:
+                    self._send_json(404, {"error": {"code": "404", "message": str(e)}})
+                except Exception as e:
+                    self._send_json(500, {"error": {"code": "500", "message": str(e)}})
+
+            def _download(self, download: dict) -> None:
+                names = download.get("names", [])
+                data = download.get("data", [])
+                if len(names) == 1 and data and data[0].get("isFile", True):
+                    file_path = server._resolve(download.get("path", "/"), names[0])
+                    with open(file_path, "rb") as f:
+                        content = f.read()
+                    self._send_range(content, names[0])
+                    return
+                self._send(200, server.archive(download), "APPLICATION/octet-stream",
+                           {"Content-disposition": "attachment; filename=Files.zip; filename*=UTF-8"})
+
+            def _send_range(self, content: bytes, name: str) -> None:
+                headers = {"Accept-Ranges": "bytes", "Content-Disposition": f'attachment; filename="{name}"'}
+                range_header = self.headers.get("Range", "")
+                if range_header.startswith("bytes="):
+                    start_text, _, end_text = range_header[len("bytes="):].partition("-")
+                    start = int(start_text or 0)
+                    end = int(end_text) if end_text else len(content) - 1
+                    if start >= len(content):
+                        self._send(416, b"", "application/octet-stream", {"Content-Range": f"bytes */{len(content)}"})
+                        return
+                    end = min(end, len(content) - 1)
+                    headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+                    self._send(206, content[start:end + 1], "application/octet-stream", headers)
+                    return
+                self._send(200, content, "application/octet-stream", headers)
+
+        return Handler
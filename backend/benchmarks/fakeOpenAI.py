@@ -0,0 +1,148 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+CHARS_PER_TOKEN = 4  # Rough prompt size estimate, good enough for the simulated latency
+
+
+class FakeOpenAI:
+    """
+    Local OpenAI-compatible endpoint answering POST /v1/chat/completions.
+
+    Point the backend at it with OPENAI_BASE_URL=<url>/v1. Each call sleeps
+    latency + completion_tokens / tokens_per_second and returns a small JSON
+    fund record derived from the request, so repeated identical requests get
+    identical answers.
+
+    Args:
+        latency: Seconds before the first token
+        tokens_per_second: Simulated generation throughput
+        completion_tokens: Tokens reported (and "generated") per response
+        rpm_limit: Answer 429 with Retry-After above this many requests per minute (None for no limit)
+    """
+
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 200.0,
+                 completion_tokens: int = 300, rpm_limit: Optional[int] = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.rpm_limit = rpm_limit
+        self.calls = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOpenAI":
+        threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _admit(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            if self.rpm_limit is not None and len(self._recent) >= self.rpm_limit:
+                self.rate_limited += 1
+                return False
+            self._recent.append(now)
+            self.calls += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            return True
+
+    def completion(self, request: dict) -> dict:
+        messages = request.get("messages", [])
+        text = "".join(str(m.get("content", "")) for m in messages)
+        prompt_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+        time.sleep(self.latency + self.completion_tokens / self.tokens_per_second)
+
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        content = {
+            "analysis": [{
+                "Fund Manager": f"Manager {digest}",
+                "Fund Name": f"Fund {digest}",
+                "Vintage Year": 2000 + int(digest, 16) % 25
+            }]
+        }
+        return {
+            "id": f"chatcmpl-{digest}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(content)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": prompt_tokens + self.completion_tokens
+            }
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                if not server._admit():
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                    {"retry-after": "1"})
+                    return
+                try:
+                    self._send_json(200, server.completion(request))
+                finally:
+                    with server._lock:
+                        server._in_flight -= 1
+
+        return Handler
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "max_in_flight": self.max_in_flight,
+            }
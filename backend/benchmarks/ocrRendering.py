@@ -0,0 +1,115 @@
+"""
+Benchmark of the page rendering step of OCR.
+
+Generates a scanned (image-only) PDF and rasterizes its pages the old way
+(pdf2image, i.e. a pdftoppm subprocess per batch, color) and the new way
+(PyMuPDF pixmaps from the open document, grayscale), optionally running
+the configured OCR engine (OCR_ENGINE) on the result, with or without the
+NumPy preprocessing of services.ocrPreprocessing. For each renderer it
+reports pages/second, the bytes of the rendered images and, with --ocr, the
+time spent preprocessing and recognizing.
+
+Run from the backend directory:
+
+    python -m benchmarks.ocrRendering --pages 20
+    python -m benchmarks.ocrRendering --pages 8 --dpi 150 --ocr --output ocr.json
+    python -m benchmarks.ocrRendering --pages 8 --ocr --preprocess
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pdf2image and PyMuPDF page rendering for OCR")
+    parser.add_argument("--pages", type=int, default=12, help="Pages of the generated scanned PDF")
+    parser.add_argument("--dpi", type=int, default=200, help="Rendering resolution")
+    parser.add_argument("--batch", type=int, default=4, help="Pages rendered per call")
+    parser.add_argument("--repeat", type=int, default=2, help="Runs per renderer")
+    parser.add_argument("--ocr", action="store_true", help="Also OCR the rendered pages with the configured engine")
+    parser.add_argument("--preprocess", action="store_true", help="Preprocess pages before OCR (with --ocr)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def run_renderer(name, render, pdf_path, doc, args):
+    from services.extractContent import get_ocr_engine, page_batches
+    from services.ocrPreprocessing import preprocess_page
+
+    engine = get_ocr_engine()
+    runs = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        rendered_bytes = 0
+        preprocess_seconds = ocr_seconds = 0.0
+        blank_pages = 0
+        for first, last in page_batches(range(1, args.pages + 1), args.batch):
+            images = render(pdf_path, doc, first, last)
+            for image in images:
+                rendered_bytes += image.width * image.height * len(image.getbands())
+                if args.ocr:
+                    page, dpi = image, args.dpi
+                    if args.preprocess:
+                        page, stats = preprocess_page(image, args.dpi)
+                        preprocess_seconds += stats["seconds"]
+                        blank_pages += stats["blank"]
+                        dpi = stats["dpi"]
+                    if page is not None:
+                        ocr_started = time.perf_counter()
+                        engine.recognize(page, dpi)
+                        ocr_seconds += time.perf_counter() - ocr_started
+                image.close()
+        seconds = time.perf_counter() - started
+        runs.append({"seconds": round(seconds, 3), "pages_per_second": round(args.pages / seconds, 2),
+                     "rendered_bytes": rendered_bytes, "preprocess_seconds": round(preprocess_seconds, 3),
+                     "ocr_seconds": round(ocr_seconds, 3), "blank_pages": blank_pages})
+    best = min(runs, key=lambda run: run["seconds"])
+    print(f"{name:>22}: {best['pages_per_second']:8.2f} pages/s  "
+          f"{best['rendered_bytes'] / 1024 / 1024:8.1f} MB rendered"
+          + (f"  {best['preprocess_seconds']:6.2f}s preprocessing  {best['ocr_seconds']:6.2f}s OCR  "
+             f"{best['blank_pages']} blank pages skipped" if args.ocr else ""))
+    return {"renderer": name, "runs": runs, "best": best}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import fitz
+    from benchmarks.syntheticData import write_scanned_pdf
+    from services.extractContent import render_pages_fitz, render_pages_pdf2image
+
+    renderers = {
+        f"pdf2image rgb {args.dpi}dpi": lambda path, doc, first, last: render_pages_pdf2image(path, first, last, args.dpi),
+        f"fitz rgb {args.dpi}dpi": lambda path, doc, first, last: render_pages_fitz(doc, first, last, args.dpi, False),
+        f"fitz gray {args.dpi}dpi": lambda path, doc, first, last: render_pages_fitz(doc, first, last, args.dpi, True),
+    }
+
+    with tempfile.TemporaryDirectory(prefix="ocr-bench-") as scratch:
+        pdf_path = os.path.join(scratch, "scanned.pdf")
+        write_scanned_pdf(pdf_path, random.Random(args.seed), "Benchmark Fund", args.pages)
+        mode = (" with preprocessing and OCR" if args.preprocess else " with OCR") if args.ocr else ""
+        print(f"Rendering {args.pages} pages at {args.dpi} DPI{mode}, best of {args.repeat}")
+        doc = fitz.open(pdf_path)
+        try:
+            results = [run_renderer(name, render, pdf_path, doc, args) for name, render in renderers.items()]
+        finally:
+            doc.close()
+
+    baseline = results[0]["best"]["pages_per_second"]
+    for result in results[1:]:
+        print(f"{result['renderer']} is {result['best']['pages_per_second'] / baseline:.2f}x the pdf2image throughput")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
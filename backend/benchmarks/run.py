@@ -0,0 +1,288 @@
+"""
+End-to-end benchmark of the analysis endpoint against local stand-ins.
+
+Generates synthetic fund folders (text PDFs, scanned PDFs, Excel files),
+serves them from a fake file server speaking the read/Download protocol,
+answers OpenAI calls from a fake endpoint with configurable latency and
+token throughput, and runs the analysis through the API a number of times.
+For each run it reports per-stage latency, throughput and peak memory: the
+resident memory of the server process and of every extraction worker
+process (where rendering and OCR run) is sampled while the run is going on.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --funds 5 --repeat 3
+    python -m benchmarks.run --llm-latency 1.5 --llm-rpm-limit 60 --output results.json
+
+Nothing is sent to the real file server or OpenAI: FILE_SERVER_URL,
+OPENAI_BASE_URL and OPENAI_API_KEY are pointed at the local servers before
+the backend is imported, and all caches and state live in a scratch directory.
+Unless --warm is given, every run starts with empty extraction and OCR caches
+and bypasses the LLM cache and analysis state, so repeats are comparable.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLL_INTERVAL = 0.2  # Seconds between job status polls
+MEMORY_SAMPLE_INTERVAL = 0.05  # Seconds between RSS samples of the server and extraction processes
+# psutil is optional; without it RSS is read from /proc (Linux only)
+PSUTIL_AVAILABLE = importlib.util.find_spec("psutil") is not None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /api/analyze against a fake file server and OpenAI endpoint")
+    data = parser.add_argument_group("synthetic data")
+    data.add_argument("--directory", default="Benchmark Funds", help="Name of the analyzed directory")
+    data.add_argument("--funds", type=int, default=3, help="Fund folders in the directory")
+    data.add_argument("--pdfs", type=int, default=3, help="Text PDFs per fund")
+    data.add_argument("--scans", type=int, default=1, help="Scanned (image-only) PDFs per fund")
+    data.add_argument("--excels", type=int, default=1, help="Excel files per fund")
+    data.add_argument("--pages", type=int, default=5, help="Pages per PDF")
+    servers = parser.add_argument_group("fake servers")
+    servers.add_argument("--file-latency", type=float, default=0.05, help="Seconds added to each file server request")
+    servers.add_argument("--bandwidth", type=float, default=None, help="File server bytes per second (default unlimited)")
+    servers.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before the first token")
+    servers.add_argument("--llm-tps", type=float, default=200.0, help="Generated tokens per second")
+    servers.add_argument("--completion-tokens", type=int, default=300, help="Tokens per response")
+    servers.add_argument("--llm-rpm-limit", type=int, default=None, help="Answer 429 above this many requests per minute")
+    run = parser.add_argument_group("runs")
+    run.add_argument("--repeat", type=int, default=1, help="Number of analysis runs")
+    run.add_argument("--warm", action="store_true",
+                     help="Keep caches and analysis state between runs (default: refresh=true and empty caches)")
+    run.add_argument("--no-tracemalloc", action="store_true", help="Skip Python heap tracking (it slows allocation-heavy code)")
+    run.add_argument("--workdir", default=None, help="Scratch directory (default: a temporary one, removed afterwards)")
+    run.add_argument("--output", default=None, help="Write the full report as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def configure_environment(workdir: str, file_server_url: str, openai_url: str) -> None:
+    """Point the backend at the fake servers and keep every cache inside workdir."""
+    os.environ["FILE_SERVER_URL"] = file_server_url
+    os.environ["OPENAI_BASE_URL"] = openai_url + "/v1"
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["EXTRACT_CACHE_PATH"] = os.path.join(workdir, "cache", "extracted_text.sqlite")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "cache", "llm_responses.sqlite")
+    os.environ["OCR_CACHE_PATH"] = os.path.join(workdir, "cache", "ocr_pages.sqlite")
+    os.environ["ANALYSIS_STATE_DIR"] = os.path.join(workdir, "analysis_state")
+    os.environ.pop("LOCAL_MIRROR_DIR", None)  # A local mirror would serve every run after the first from disk
+
+
+def clear_persistent_caches() -> None:
+    """
+    Empty the extraction and OCR page caches before a cold run: refresh=true
+    only bypasses the LLM cache and the analysis state.
+    """
+    from services.extractCache import extract_cache
+    from services.ocrCache import ocr_cache
+
+    extract_cache.clear()
+    ocr_cache.clear()
+
+
+def rss_bytes(pid: int):
+    """Return the resident memory of a process, or None when it is gone or cannot be read."""
+    try:
+        if PSUTIL_AVAILABLE:
+            import psutil
+            return psutil.Process(pid).memory_info().rss
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+class MemorySampler:
+    """
+    Samples the RSS of the server process and of every extraction worker
+    process in a background thread while a run is going on.
+
+    ru_maxrss would only cover the server process, where neither rendering
+    nor OCR runs, and keeps its maximum across runs; the sampler starts from
+    zero for every run.
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peaks = {}  # process label -> peak RSS in bytes
+        self.peak_total = 0  # peak of the RSS of all processes at the same moment
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def sample(self) -> None:
+        from services.extractionPool import worker_pids
+
+        processes = {"server": os.getpid()}
+        processes.update({f"extraction worker {pid}": pid for pid in worker_pids()})
+        total = 0
+        for label, pid in processes.items():
+            rss = rss_bytes(pid)
+            if rss is None:
+                continue
+            total += rss
+            self.peaks[label] = max(self.peaks.get(label, 0), rss)
+        self.peak_total = max(self.peak_total, total)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> "MemorySampler":
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def report(self) -> dict:
+        def mb(nbytes: int) -> float:
+            return round(nbytes / (1024 * 1024), 1)
+
+        return {"total": mb(self.peak_total), "processes": {label: mb(peak) for label, peak in self.peaks.items()}}
+
+
+def run_once(client, directory: str, refresh: bool, trace_memory: bool) -> dict:
+    """Submit one analysis job, wait for it and collect its timings and counters."""
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with MemorySampler() as memory:
+        response = client.post("/api/jobs/analyze", params={"directory_name": directory, "refresh": refresh})
+        job_id = response.json()["job_id"]
+        while True:
+            status = client.get(f"/api/jobs/{job_id}").json()
+            if status["status"] in ("completed", "failed"):
+                break
+            time.sleep(POLL_INTERVAL)
+    wall_time = time.perf_counter() - start
+    result = client.get(f"/api/jobs/{job_id}/result").json()
+
+    counters = status["progress"]["counters"]
+    stages = {
+        name: stage["duration_seconds"]
+        for name, stage in status["progress"]["stages"].items()
+        if stage.get("duration_seconds") is not None
+    }
+    files = counters.get("files_discovered", 0) or counters.get("files_downloaded", 0)
+    return {
+        "status": status["status"],
+        "error": status.get("error") or (None if result.get("success") else result.get("message")),
+        "wall_seconds": round(wall_time, 3),
+        "stages": stages,
+        "throughput": {
+            "files_per_second": round(files / wall_time, 2) if wall_time else None,
+            "download_mb_per_second": round(counters.get("bytes_downloaded", 0) / (1024 * 1024) / wall_time, 2)
+            if wall_time else None,
+            "pages_per_second": round(
+                (counters.get("pages_extracted", 0)) / stages["extract"], 2
+            ) if stages.get("extract") else None,
+            "llm_calls": counters.get("llm_calls_completed", 0),
+            "prompt_tokens": counters.get("prompt_tokens", 0),
+            "completion_tokens": counters.get("completion_tokens", 0),
+            "llm_wait_seconds": round(counters.get("llm_wait_seconds", 0), 3),
+            "download_concurrency": status["progress"].get("gauges", {}).get("download_concurrency"),
+        },
+        "counters": counters,
+        "peak_python_heap_mb": round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1) if trace_memory else None,
+        "peak_rss_mb": memory.report(),
+    }
+
+
+def print_report(report: dict) -> None:
+    print("\n=== Benchmark report ===")
+    print(f"Dataset: {json.dumps(report['dataset'])}")
+    for index, run in enumerate(report["runs"], start=1):
+        print(f"\nRun {index}: {run['status']} in {run['wall_seconds']}s"
+              + (f" (error: {run['error']})" if run["error"] else ""))
+        for name, duration in sorted(run["stages"].items(), key=lambda item: -item[1]):
+            print(f"  {name:<16} {duration:>8.3f}s")
+        for name, value in run["throughput"].items():
+            print(f"  {name:<24} {value}")
+        print(f"  peak Python heap (MB)    {run['peak_python_heap_mb']}")
+        print(f"  peak RSS (MB)            {run['peak_rss_mb']['total']} (all processes)")
+        for label, peak in sorted(run["peak_rss_mb"]["processes"].items()):
+            print(f"    {label:<26} {peak}")
+    print(f"\nFake file server: {json.dumps(report['file_server'])}")
+    print(f"Fake OpenAI: {json.dumps(report['openai'])}")
+
+
+def main(argv=None) -> dict:
+    args = parse_args(argv)
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="analysis-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.fakeFileServer import FakeFileServer
+    from benchmarks.fakeOpenAI import FakeOpenAI
+    from benchmarks.syntheticData import generate_dataset
+
+    files_root = os.path.join(workdir, "files")
+    print(f"Generating synthetic data in {files_root}")
+    dataset = generate_dataset(
+        files_root, args.directory, funds=args.funds, pdfs_per_fund=args.pdfs,
+        scanned_per_fund=args.scans, excels_per_fund=args.excels, pages=args.pages
+    )
+
+    file_server = FakeFileServer(files_root, latency=args.file_latency, bandwidth=args.bandwidth).start()
+    openai_server = FakeOpenAI(
+        latency=args.llm_latency, tokens_per_second=args.llm_tps,
+        completion_tokens=args.completion_tokens, rpm_limit=args.llm_rpm_limit
+    ).start()
+    configure_environment(workdir, file_server.url, openai_server.url)
+
+    # The backend reads its configuration at import time and writes relative to the working directory
+    run_dir = os.path.join(workdir, "run")
+    os.makedirs(run_dir, exist_ok=True)
+    previous_cwd = os.getcwd()
+    os.chdir(run_dir)
+    trace_memory = not args.no_tracemalloc
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        from fastapi.testclient import TestClient
+        from main import app
+
+        runs = []
+        # Entering the client runs the startup hooks, so the extraction pool is warm before run 1
+        with TestClient(app) as client:
+            for index in range(args.repeat):
+                print(f"Run {index + 1}/{args.repeat}")
+                if not args.warm:
+                    clear_persistent_caches()
+                runs.append(run_once(client, args.directory, refresh=not args.warm, trace_memory=trace_memory))
+        report = {
+            "dataset": dataset,
+            "runs": runs,
+            "file_server": file_server.requests,
+            "openai": openai_server.stats(),
+        }
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        os.chdir(previous_cwd)
+        file_server.stop()
+        openai_server.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
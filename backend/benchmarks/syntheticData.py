@@ -0,0 +1,112 @@
+import os
+import random
+from typing import Dict
+
+import fitz  # PyMuPDF
+import pandas as pd
+
+SECTORS = ["Fintech", "Healthcare", "SaaS", "Climate", "Gaming", "Logistics", "Consumer", "Deep Tech"]
+STAGES = ["Seed", "Series A", "Series B", "Growth"]
+LINES_PER_PAGE = 40
+
+
+def _fund_lines(rng: random.Random, fund_name: str, page: int) -> list:
+    lines = [f"{fund_name} - Quarterly Report, page {page + 1}", ""]
+    for _ in range(LINES_PER_PAGE - 2):
+        company = f"{rng.choice(['Nova', 'Apex', 'Blue', 'Quant', 'Orbit', 'Terra'])}{rng.randint(10, 99)}"
+        lines.append(
+            f"{company}: {rng.choice(SECTORS)}, {rng.choice(STAGES)}, invested ${rng.randint(1, 40)}M, "
+            f"ownership {rng.randint(2, 30)}%, MOIC {rng.uniform(0.5, 5):.2f}x"
+        )
+    return lines
+
+
+def write_text_pdf(path: str, rng: random.Random, fund_name: str, pages: int) -> None:
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_text((40, 50), "\n".join(_fund_lines(rng, fund_name, page_number)), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def write_scanned_pdf(path: str, rng: random.Random, fund_name: str, pages: int, dpi: int = 150) -> None:
+    """Write a PDF whose pages are images only, so extraction has to fall back to OCR."""
+    text_doc = fitz.open()
+    scanned = fitz.open()
+    for page_number in range(pages):
+        page = text_doc.new_page()
+        page.insert_text((40, 50), "\n".join(_fund_lines(rng, fund_name, page_number)), fontsize=9)
+        pixmap = page.get_pixmap(dpi=dpi)
+        scanned_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        scanned_page.insert_image(scanned_page.rect, stream=pixmap.tobytes("png"))
+    scanned.save(path)
+    scanned.close()
+    text_doc.close()
+
+
+def write_excel(path: str, rng: random.Random, fund_name: str, rows: int) -> None:
+    portfolio = pd.DataFrame({
+        "Company": [f"Portfolio {i}" for i in range(rows)],
+        "Sector": [rng.choice(SECTORS) for _ in range(rows)],
+        "Stage": [rng.choice(STAGES) for _ in range(rows)],
+        "Invested ($M)": [rng.randint(1, 40) for _ in range(rows)],
+        "Fair Value ($M)": [round(rng.uniform(0.5, 120), 1) for _ in range(rows)],
+    })
+    summary = pd.DataFrame({
+        "Fund Name": [fund_name],
+        "Fund Manager": [f"{fund_name.split()[0]} Capital"],
+        "Fund Size ($M)": [rng.randint(50, 900)],
+        "Vintage Year": [rng.randint(2010, 2024)],
+    })
+    with pd.ExcelWriter(path) as writer:
+        summary.to_excel(writer, sheet_name="Summary", index=False)
+        portfolio.to_excel(writer, sheet_name="Portfolio", index=False)
+
+
+def generate_dataset(
+    root: str,
+    directory_name: str = "Benchmark Funds",
+    funds: int = 3,
+    pdfs_per_fund: int = 3,
+    scanned_per_fund: int = 1,
+    excels_per_fund: int = 1,
+    pages: int = 5,
+    excel_rows: int = 50,
+    seed: int = 42
+) -> Dict[str, int]:
+    """
+    Write synthetic fund folders under root/directory_name:
+
+        <directory_name>/Fund N/Reports/report_K.pdf   (text PDFs)
+        <directory_name>/Fund N/Scans/scan_K.pdf       (image-only PDFs)
+        <directory_name>/Fund N/portfolio_K.xlsx
+
+    Returns:
+        dict: Number of files of each kind and total bytes written
+    """
+    rng = random.Random(seed)
+    totals = {"text_pdfs": 0, "scanned_pdfs": 0, "excels": 0, "bytes": 0}
+    for fund_index in range(funds):
+        fund_name = f"Fund {fund_index + 1}"
+        fund_dir = os.path.join(root, directory_name, fund_name)
+        os.makedirs(os.path.join(fund_dir, "Reports"), exist_ok=True)
+        os.makedirs(os.path.join(fund_dir, "Scans"), exist_ok=True)
+        written = []
+        for k in range(pdfs_per_fund):
+            path = os.path.join(fund_dir, "Reports", f"report_{k + 1}.pdf")
+            write_text_pdf(path, rng, fund_name, pages)
+            written.append(path)
+            totals["text_pdfs"] += 1
+        for k in range(scanned_per_fund):
+            path = os.path.join(fund_dir, "Scans", f"scan_{k + 1}.pdf")
+            write_scanned_pdf(path, rng, fund_name, pages)
+            written.append(path)
+            totals["scanned_pdfs"] += 1
+        for k in range(excels_per_fund):
+            path = os.path.join(fund_dir, f"portfolio_{k + 1}.xlsx")
+            write_excel(path, rng, fund_name, excel_rows)
+            written.append(path)
+            totals["excels"] += 1
+        totals["bytes"] += sum(os.path.getsize(path) for path in written)
+    return totals
@@ -1,28 +1,27 @@
 import asyncio
-import uuid
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+import json
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-from services.fileUpload import create_folder_and_upload_files
-from services.combineDocAnalysis import combine_doc_analyses
-from services.comgineExcelAnalysis import combine_excel_analyses
-from services.analyzer import process_hierarchical_data
-from services.saveJosn import write_extracted_content_json
-from services.files import download_files, find_alpine_vc_files, get_directory_list, listFiles, get_all_files
-from services.extractContent import extractContent
-from services.analyzeDocuments import analyzeDocuments
-import os
-import tempfile
-import requests
-from prompts import system_prompt, system_prompt_doc, system_prompt_excel
-from services.saveExcel import save_to_excel
-from services.saveDoc import save_multiple_analyses_to_docx
-import shutil
-import time
+from typing import List, Optional
+from pydantic import BaseModel
+from services.analysisState import delete_state
+from services.extractCache import extract_cache
+from services.extractContent import shutdown_ocr
+from services.extractionPool import shutdown_extraction_pool, warm_extraction_pool
+from services.llmCache import get_llm_cache
+from services.ocrCache import ocr_cache
+from services.localMirror import local_mirror
+from services.httpClient import http_pool
+from services.jobs import JOB_COMPLETED, JOB_FAILED, get_job, submit_job
+from services.rateLimiter import openai_scheduler
+from services.pipeline import run_analysis, run_batch_analysis
+from services.treeIndex import tree_index
 from file_server.route import router as fileServerRouter
 
 UPLOAD_DIR = "temp_uploads"
+EVENT_POLL_INTERVAL = 0.5  # Seconds between checks for new progress events
+EVENT_KEEPALIVE_INTERVAL = 15  # Seconds between SSE keep-alive comments
 
 app = FastAPI()
 
@@ -36,54 +35,155 @@ app.add_middleware(
 
 app.include_router(fileServerRouter, prefix="/api/file-server")
 
+@app.on_event("startup")
+async def start_extraction_pool():
+    # Workers start in the background so the server accepts requests right away
+    asyncio.get_running_loop().run_in_executor(None, warm_extraction_pool)
+
+
+@app.on_event("shutdown")
+async def stop_extraction_pool():
+    shutdown_extraction_pool()
+    # OCR of files extracted in this process (pool disabled or broken)
+    shutdown_ocr()
+
+
 @app.post("/api/analyze")
-async def analyze_company(directory_name: str):
-    folder_name = uuid.uuid4()
-    str_folder_name = str(folder_name)  # Convert UUID to string right after creation
-    
+async def analyze_company(directory_name: str, refresh: bool = False):
+    # Run the analysis on the job pool so the event loop stays responsive
+    job = submit_job("analyze", run_analysis, str(directory_name), None, refresh,
+                     directory_name=str(directory_name), refresh=refresh)
     try:
-        start_time = time.time()
-        # Get the list of files from the server
-        files = listFiles()
-        # print("files",files)
-        # directory_name = "8-Bit Capital"
-        print("directory",str(directory_name))
-        target_dir = get_directory_list(files, str(directory_name))
-        
-
-        all_file_urls = get_all_files(target_dir)
-        # print("all file url",all_file_urls)
-        
-        # Download the files
-        downloaded_files = download_files(all_file_urls, str_folder_name)  # Use string version
-        print("Downloaded files:", downloaded_files)
-        
-        # # Rest of your code using str_folder_name
-        result_location = write_extracted_content_json(str_folder_name)
-        final_result_location = process_hierarchical_data(result_location, system_prompt_excel, system_prompt_doc)
-        combinedExcelAnalysis = combine_excel_analyses(final_result_location)
-        combinedDocAnalysis = combine_doc_analyses(final_result_location)
-        # saved_files = save_multiple_analyses_to_docx(combinedDocAnalysis, str_folder_name)
-        # create_folder_and_upload_files(saved_files, 'docOutput')
-        # return JSONResponse(content={"success": True,files:files})
-        end_time = time.time()  # End the timer
-        total_time = end_time - start_time  # Calculate execution time in seconds
-        return JSONResponse(content={"success": True, "title":directory_name ,"excel": combinedExcelAnalysis, "doc": combinedDocAnalysis,"time_taken_seconds": round(total_time, 2)})
-    
+        result = await asyncio.wrap_future(job.future)
+        return JSONResponse(content=result)
     except Exception as e:
         return JSONResponse(content={"success": False, "message": str(e)}, status_code=500)
-    
-    finally:
-        folder_path = os.path.join(UPLOAD_DIR, str_folder_name)  # Use string version here
-        try:
-            if os.path.exists(folder_path):
-                print(f"Cleaning up temporary folder: {folder_path}")
-                shutil.rmtree(folder_path)
-                print(f"Successfully removed {folder_path}")
-            else:
-                print(f"Folder {folder_path} does not exist, no cleanup needed")
-        except Exception as cleanup_error:
-            print(f"Error during cleanup: {str(cleanup_error)}")
+
+
+@app.post("/api/jobs/analyze")
+async def submit_analysis_job(directory_name: str, refresh: bool = False):
+    job = submit_job("analyze", run_analysis, str(directory_name), None, refresh,
+                     directory_name=str(directory_name), refresh=refresh)
+    return JSONResponse(content={"success": True, "job_id": job.id, "status": job.status}, status_code=202)
+
+
+@app.get("/api/llm/scheduler")
+async def get_llm_scheduler_stats():
+    return JSONResponse(content={"success": True, "scheduler": openai_scheduler.stats()})
+
+
+@app.get("/api/http/stats")
+async def get_http_stats():
+    return JSONResponse(content={"success": True, "http": http_pool.stats()})
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return JSONResponse(content={
+        "success": True,
+        "caches": [extract_cache.stats(), ocr_cache.stats(), *get_llm_cache().stats(), tree_index.stats()]
+        + ([local_mirror.stats()] if local_mirror is not None else [])
+    })
+
+
+@app.post("/api/tree/invalidate")
+async def invalidate_tree(directory_name: Optional[str] = None):
+    # Call after files were added, moved or removed on the file server
+    tree_index.invalidate(directory_name)
+    return JSONResponse(content={"success": True})
+
+
+@app.delete("/api/analysis-state")
+async def forget_analysis_state(directory_name: str):
+    # The next analysis of the directory re-analyzes every file
+    deleted = delete_state(str(directory_name))
+    return JSONResponse(content={"success": True, "deleted": deleted})
+
+
+class BatchAnalyzeRequest(BaseModel):
+    directory_names: List[str]
+    refresh: bool = False
+
+
+@app.post("/api/jobs/batch")
+async def submit_batch_job(request: BatchAnalyzeRequest):
+    if not request.directory_names:
+        return JSONResponse(content={"success": False, "message": "directory_names must not be empty"}, status_code=400)
+    job = submit_job("batch", run_batch_analysis, request.directory_names, request.refresh,
+                     directory_names=request.directory_names, refresh=request.refresh)
+    return JSONResponse(content={"success": True, "job_id": job.id, "status": job.status}, status_code=202)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(content={"success": False, "message": "Job not found"}, status_code=404)
+    return JSONResponse(content={"success": True, **job.to_dict()})
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(content={"success": False, "message": "Job not found"}, status_code=404)
+    if job.status == JOB_FAILED:
+        return JSONResponse(content={"success": False, "job_id": job.id, "message": job.error}, status_code=500)
+    if job.status != JOB_COMPLETED:
+        # Batch jobs expose the directories finished so far
+        return JSONResponse(content={
+            "success": False,
+            "job_id": job.id,
+            "status": job.status,
+            "partial_results": dict(job.progress.partial_results)
+        }, status_code=202)
+    return JSONResponse(content=job.result)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream the progress events of a job as Server-Sent Events.
+
+    Each event carries its sequence number as the SSE id, so a reconnecting
+    client (Last-Event-ID header) resumes where it left off. The stream ends
+    with a "finished" event holding the final counters and stage timings.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(content={"success": False, "message": "Job not found"}, status_code=404)
+
+    try:
+        last_seq = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        last_seq = 0
+
+    async def event_stream():
+        nonlocal last_seq
+        idle_time = 0.0
+        while True:
+            if await request.is_disconnected():
+                break
+            closed = job.progress.closed
+            events = job.progress.events_since(last_seq)
+            for event in events:
+                last_seq = event["seq"]
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if closed and not job.progress.events_since(last_seq):
+                break
+            if events:
+                idle_time = 0.0
+            elif idle_time >= EVENT_KEEPALIVE_INTERVAL:
+                idle_time = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+            idle_time += EVENT_POLL_INTERVAL
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 
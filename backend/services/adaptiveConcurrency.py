@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from services.progress import emit, gauge
+
+ADAPTIVE_MIN_SAMPLES = 4  # Completed requests per adjustment at the lowest limits
+ADAPTIVE_ERROR_RATE = 0.1  # Share of failed requests in a window that halves the limit
+ADAPTIVE_LATENCY_TOLERANCE = 2.0  # Latency above this multiple of the best seen counts as queueing
+ADAPTIVE_THROUGHPUT_GAIN = 0.05  # Relative throughput gain that justifies the extra latency
+ADAPTIVE_DECREASE_FACTOR = 0.5  # Multiplicative decrease after errors
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the number of requests in flight.
+
+    Requests are observed in windows of about `limit` completions. After each
+    window the limit is:
+      - halved when more than ADAPTIVE_ERROR_RATE of the requests failed,
+      - lowered by one when the average latency grew beyond
+        ADAPTIVE_LATENCY_TOLERANCE times the best window without throughput
+        improving (requests queue up at the server instead of finishing faster),
+      - raised by one when every slot was in use, probing for more throughput.
+
+    Args:
+        name: Label of the limiter in events and gauges (e.g. "download_concurrency")
+        max_limit: Upper bound of the limit
+        initial: Limit to start from
+        min_limit: Lower bound of the limit
+    """
+
+    def __init__(self, name: str, max_limit: int, initial: int, min_limit: int = 1):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = max(self.min_limit, min(initial, self.max_limit))
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.adjustments = 0
+        self.completed = 0
+        self.failed = 0
+        self.best_latency: Optional[float] = None
+        self.last_throughput: Optional[float] = None
+        self._cond = threading.Condition()
+        self._reset_window()
+        gauge(self.name, self.limit)
+
+    def _reset_window(self) -> None:
+        # Requests still in flight finish in the next window, which starts now
+        self._window_started: Optional[float] = time.time() if self.in_flight else None
+        self._window_count = 0
+        self._window_errors = 0
+        self._window_bytes = 0
+        self._window_seconds = 0.0
+        self._saturated = False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._saturated = True
+                self._cond.wait()
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+            if self._window_started is None:
+                self._window_started = time.time()
+
+    def release(self, ok: bool, nbytes: int, seconds: float) -> None:
+        """Return a slot and record how the request went."""
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            self._window_count += 1
+            self._window_seconds += seconds
+            self._window_bytes += nbytes
+            if not ok:
+                self.failed += 1
+                self._window_errors += 1
+            if self._window_count >= max(self.limit, ADAPTIVE_MIN_SAMPLES):
+                self._adjust()
+            self._cond.notify_all()
+
+    def _adjust(self) -> None:
+        # Called with the condition held, once per window
+        elapsed = max(time.time() - self._window_started, 1e-6)
+        throughput = self._window_bytes / elapsed
+        latency = self._window_seconds / self._window_count
+        error_rate = self._window_errors / self._window_count
+
+        previous = self.limit
+        reason = None
+        if error_rate > ADAPTIVE_ERROR_RATE:
+            self.limit = max(self.min_limit, int(self.limit * ADAPTIVE_DECREASE_FACTOR))
+            reason = "errors"
+        elif (self.best_latency is not None and latency > self.best_latency * ADAPTIVE_LATENCY_TOLERANCE
+              and self.last_throughput is not None
+              and throughput <= self.last_throughput * (1 + ADAPTIVE_THROUGHPUT_GAIN)):
+            self.limit = max(self.min_limit, self.limit - 1)
+            reason = "latency"
+        elif self._saturated:
+            self.limit = min(self.max_limit, self.limit + 1)
+            reason = "probe"
+
+        if not self._window_errors:
+            self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        self.last_throughput = throughput
+        self.peak_limit = max(self.peak_limit, self.limit)
+        self._reset_window()
+
+        if self.limit != previous:
+            self.adjustments += 1
+            gauge(self.name, self.limit)
+            emit(f"{self.name}_changed", limit=self.limit, previous=previous, reason=reason,
+                 throughput_bytes_per_second=round(throughput), latency_seconds=round(latency, 3),
+                 error_rate=round(error_rate, 3))
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one slot for the duration of a request.
+
+        Yields a dict in which the caller records the outcome: "ok" (False for
+        a failed request), "bytes" (bytes transferred) and optionally
+        "seconds", the latency of the request itself when the block also waits
+        for something else (by default the whole block is timed). A request
+        raising an exception counts as failed.
+        """
+        self.acquire()
+        outcome = {"ok": True, "bytes": 0, "seconds": None}
+        start = time.time()
+        try:
+            yield outcome
+        except Exception:
+            outcome["ok"] = False
+            raise
+        finally:
+            seconds = outcome["seconds"] if outcome["seconds"] is not None else time.time() - start
+            self.release(outcome["ok"], outcome["bytes"], seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": self.limit,
+                "max_limit": self.max_limit,
+                "peak_limit": self.peak_limit,
+                "in_flight": self.in_flight,
+                "adjustments": self.adjustments,
+                "completed": self.completed,
+                "failed": self.failed,
+                "best_latency_seconds": round(self.best_latency, 3) if self.best_latency is not None else None,
+            }
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+INCREMENTAL_ANALYSIS = True  # Reuse stored analyses of unchanged files when a directory is analyzed again
+ANALYSIS_STATE_DIR = os.getenv("ANALYSIS_STATE_DIR", "analysis_state")
+STATE_VERSION = 1
+
+_state_lock = threading.Lock()
+
+
+def _state_path(directory_name: str) -> str:
+    digest = hashlib.sha256(directory_name.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(ANALYSIS_STATE_DIR, f"{digest}.json")
+
+
+def analysis_fingerprint(*parts: str) -> str:
+    """
+    Hash everything besides the files that determines an analysis result
+    (prompts, model, chunk limits). Stored analyses are only reused when the
+    fingerprint matches.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_signature(metadata: Dict[str, Any]) -> Optional[List[Any]]:
+    """
+    Return the (size, dateModified) signature of a file from the file server
+    metadata, or None when either value is unknown (such files always count as changed).
+    """
+    size = metadata.get("size")
+    modified = metadata.get("dateModified")
+    if size is None or modified is None:
+        return None
+    return [size, modified]
+
+
+def load_state(directory_name: str, fingerprint: str) -> Dict[str, Any]:
+    """
+    Load the stored state of a directory.
+
+    The state looks like:
+    {
+        "version": 1,
+        "directory": <directory name>,
+        "fingerprint": <analysis fingerprint>,
+        "updated_at": <timestamp>,
+        "files": {<relative path>: {"signature": [size, dateModified], "content": <extracted text>,
+                                    "sha256": <content hash or None>}},
+        "chunks": [{"folder": <top-level folder>, "files": [<relative path>, ...],
+                    "excel_analysis": {...}, "doc_analysis": {...}}]
+    }
+
+    Returns:
+        The stored state, or an empty state if there is none or it was produced
+        with a different fingerprint
+    """
+    empty = {"version": STATE_VERSION, "directory": directory_name, "fingerprint": fingerprint, "files": {}, "chunks": []}
+    path = _state_path(directory_name)
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception as e:
+        print(f"Could not read analysis state for '{directory_name}': {str(e)}")
+        return empty
+    if state.get("version") != STATE_VERSION or state.get("fingerprint") != fingerprint:
+        print(f"Stored analysis state for '{directory_name}' is outdated, analyzing everything")
+        return empty
+    return state
+
+
+def save_state(directory_name: str, state: Dict[str, Any]) -> None:
+    """Atomically write the state of a directory."""
+    os.makedirs(ANALYSIS_STATE_DIR, exist_ok=True)
+    state = {**state, "version": STATE_VERSION, "directory": directory_name, "updated_at": time.time()}
+    path = _state_path(directory_name)
+    with _state_lock:
+        fd, tmp_path = tempfile.mkstemp(dir=ANALYSIS_STATE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def delete_state(directory_name: str) -> bool:
+    """Forget the stored state of a directory. Returns True if there was one."""
+    path = _state_path(directory_name)
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
@@ -1,17 +1,147 @@
 import os
-import asyncio
+import time
 from typing import List, Dict, Any
 import tiktoken
 from pydantic import BaseModel
-from openai import OpenAI, AsyncOpenAI
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.progress import emit, propagate_context
+from services.llmCache import LLM_CACHE_ENABLED, bypass_llm_cache, cache_bypassed, get_llm_cache, response_cache_key
+from services.rateLimiter import OPENAI_BACKOFF_SECONDS, OPENAI_RETRIES, call_priority, openai_scheduler
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+ESTIMATED_COMPLETION_TOKENS = 2000  # Reserved per call for the response until the real usage is known
+RESPONSE_FORMAT = {"type": "json_object"}
+# Retried by create_chat_completion through the scheduler (timeouts are connection errors)
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+# The SDK does not retry by itself: a retry inside a scheduler slot would hide 429s from the scheduler
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+def estimate_request_tokens(messages: List[Dict], model: str) -> int:
+    """
+    Estimate the tokens a chat completion request will use (prompt plus a
+    reserve for the completion), for admission against the tokens-per-minute budget.
+    """
+    # Roughly 4 tokens of formatting per message on top of its content
+    prompt_tokens = sum(count_tokens(str(m.get("content", "")), model) + 4 for m in messages)
+    return prompt_tokens + ESTIMATED_COMPLETION_TOKENS
+
+def _retry_after_seconds(error: Exception):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def create_chat_completion(messages: List[Dict], model: str, call_type: str = "analysis") -> str:
+    """
+    Send a JSON-mode chat completion request and return the message content.
+    
+    All synchronous OpenAI calls go through this function so that in-flight
+    calls, token usage and latency are reported to the progress tracker, so
+    that every call is admitted by the process-wide rate-limit scheduler
+    (see services/rateLimiter.py), and so that identical requests are answered
+    from the response cache (see services/llmCache.py) unless the run bypasses it.
+    Rate-limit, connection and server errors are retried here (the SDK's own
+    retries are off), so the scheduler sees every 429 and pauses admissions.
+    
+    Args:
+        messages: The chat messages to send
+        model: The model to use
+        call_type: Kind of call for progress reporting and scheduling priority
+                   (single, chunk, consolidation)
+        
+    Returns:
+        The content of the first choice (a JSON string)
+    """
+    cache = get_llm_cache()
+    cache_key = response_cache_key(model, messages, RESPONSE_FORMAT)
+    if not cache_bypassed():
+        try:
+            cached = cache.get(cache_key)
+        except Exception as e:
+            print(f"LLM cache lookup failed: {str(e)}")
+            cached = None
+        if cached is not None:
+            print(f"LLM cache hit for {call_type} call")
+            emit("llm_cache_hit", counters={"llm_cache_hits": 1}, model=model, call_type=call_type)
+            return cached
+        emit("llm_cache_miss", counters={"llm_cache_misses": 1}, model=model, call_type=call_type)
+    
+    estimated_tokens = estimate_request_tokens(messages, model)
+    for attempt in range(OPENAI_RETRIES + 1):
+        # Every attempt is admitted again, so a retry after a 429 waits for the scheduler's pause
+        with openai_scheduler.slot(estimated_tokens, call_priority(call_type)) as admission:
+            emit(
+                "llm_call_started",
+                counters={"llm_calls_in_flight": 1, "llm_wait_seconds": admission["wait_seconds"]},
+                model=model,
+                call_type=call_type,
+                estimated_tokens=estimated_tokens,
+                wait_seconds=round(admission["wait_seconds"], 3),
+                attempt=attempt + 1
+            )
+            start_time = time.time()
+            try:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    response_format=RESPONSE_FORMAT
+                )
+            except Exception as e:
+                if isinstance(e, RateLimitError):
+                    # Hold back every other call instead of letting them hit the limit too
+                    openai_scheduler.pause(_retry_after_seconds(e))
+                retry = isinstance(e, RETRYABLE_ERRORS) and attempt < OPENAI_RETRIES
+                emit("llm_call_failed",
+                     counters={"llm_calls_in_flight": -1, "llm_calls_failed": 1, "llm_calls_retried": int(retry)},
+                     model=model, call_type=call_type, error=str(e), retry=retry)
+                if not retry:
+                    raise
+                rate_limited = isinstance(e, RateLimitError)
+                response = None
+            else:
+                usage = getattr(response, "usage", None)
+                prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+                if usage is not None:
+                    admission["used_tokens"] = prompt_tokens + completion_tokens
+        if response is not None:
+            break
+        if not rate_limited:
+            time.sleep(OPENAI_BACKOFF_SECONDS * 2 ** attempt)
+    
+    emit(
+        "llm_call_completed",
+        counters={
+            "llm_calls_in_flight": -1,
+            "llm_calls_completed": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens
+        },
+        model=model,
+        call_type=call_type,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        duration_seconds=round(time.time() - start_time, 3)
+    )
+    content = response.choices[0].message.content
+    
+    # A refresh run still writes through; a disabled cache is neither read nor written
+    if not LLM_CACHE_ENABLED:
+        return content
+    # Only cache well-formed JSON so a bad response is retried next time
+    try:
+        json.loads(content)
+        cache.set(cache_key, content)
+    except Exception as e:
+        print(f"Not caching {call_type} response: {str(e)}")
+    return content
 
 def count_tokens(text: str, model: str = "gpt-4o") -> int:
     """
@@ -78,47 +208,6 @@ def chunk_document_by_tokens(document: str, max_tokens: int = 120000, model: str
     
     return chunks
 
-async def process_chunk_async(chunk: str, chunk_index: int, total_chunks: int, prompt: str, model: str) -> Dict:
-    """
-    Process a single chunk asynchronously.
-    
-    Args:
-        chunk: The chunk text to process
-        chunk_index: The index of this chunk (1-based)
-        total_chunks: Total number of chunks
-        prompt: The system prompt
-        model: The model to use
-        
-    Returns:
-        Analysis result for this chunk
-    """
-    chunk_prompt = f"""
-    {prompt}
-    
-    This is part {chunk_index}/{total_chunks} of a large document. 
-    Process this part and extract all fund data that you can find.
-    """
-    
-    messages = [
-        {"role": "system", "content": chunk_prompt},
-        {"role": "user", "content": f"Input Document Part {chunk_index}: {chunk}"}
-    ]
-    
-    try:
-        response = await async_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            response_format={"type": "json_object"}
-        )
-        
-        chunk_analysis = json.loads(response.choices[0].message.content)
-        print(f"Successfully processed chunk {chunk_index}")
-        return chunk_analysis
-    except Exception as e:
-        print(f"Error processing chunk {chunk_index}: {str(e)}")
-        # Return an empty result on error
-        return {"error": str(e), "chunk": chunk_index}
-
 def process_chunk(chunk: str, chunk_index: int, total_chunks: int, prompt: str, model: str) -> Dict:
     """
     Process a single chunk synchronously.
@@ -146,13 +235,7 @@ def process_chunk(chunk: str, chunk_index: int, total_chunks: int, prompt: str,
     ]
     
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            response_format={"type": "json_object"}
-        )
-        
-        chunk_analysis = json.loads(response.choices[0].message.content)
+        chunk_analysis = json.loads(create_chat_completion(messages, model, "chunk"))
         print(f"Successfully processed chunk {chunk_index}")
         return chunk_analysis
     except Exception as e:
@@ -160,37 +243,6 @@ def process_chunk(chunk: str, chunk_index: int, total_chunks: int, prompt: str,
         # Return an empty result on error
         return {"error": str(e), "chunk": chunk_index}
 
-async def process_chunks_parallel_async(chunks: List[str], prompt: str, model: str, max_parallel: int = 5) -> List[Dict]:
-    """
-    Process chunks in parallel using async/await.
-    
-    Args:
-        chunks: List of document chunks
-        prompt: System prompt
-        model: Model to use
-        max_parallel: Maximum number of parallel requests
-        
-    Returns:
-        List of analysis results
-    """
-    results = []
-    
-    # Process in batches of max_parallel
-    for i in range(0, len(chunks), max_parallel):
-        batch = chunks[i:i+max_parallel]
-        batch_indices = list(range(i+1, i+len(batch)+1))
-        
-        print(f"Processing batch of {len(batch)} chunks in parallel")
-        tasks = [
-            process_chunk_async(chunk, idx, len(chunks), prompt, model)
-            for chunk, idx in zip(batch, batch_indices)
-        ]
-        
-        batch_results = await asyncio.gather(*tasks)
-        results.extend(batch_results)
-    
-    return results
-
 def process_chunks_parallel(chunks: List[str], prompt: str, model: str, max_parallel: int = 5) -> List[Dict]:
     """
     Process chunks in parallel using ThreadPoolExecutor.
@@ -210,7 +262,7 @@ def process_chunks_parallel(chunks: List[str], prompt: str, model: str, max_para
         # Submit all tasks
         future_to_index = {
             executor.submit(
-                process_chunk, 
+                propagate_context(process_chunk), 
                 chunk, 
                 idx+1, 
                 len(chunks), 
@@ -233,7 +285,7 @@ def process_chunks_parallel(chunks: List[str], prompt: str, model: str, max_para
     
     return results
 
-def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5):
+def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5, use_cache=True):
     """
     Analyze documents using OpenAI API with proper token management and parallel processing.
     
@@ -242,10 +294,15 @@ def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5):
         prompt: The system prompt to use for analysis
         model: The model to use for analysis
         max_parallel: Maximum number of parallel chunks to process
+        use_cache: Whether cached responses may be reused (fresh responses are cached either way)
         
     Returns:
         Analysis results
     """
+    if not use_cache:
+        with bypass_llm_cache():
+            return analyzeDocuments(documents, prompt, model, max_parallel)
+    
     print("Analyzing documents")
     
     document = str(documents)
@@ -267,13 +324,7 @@ def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5):
                 {"role": "user", "content": f"Input Document: {document}"}
             ]
             
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                response_format={"type": "json_object"}
-            )
-            
-            analysis = response.choices[0].message.content
+            analysis = create_chat_completion(messages, model, "single")
             print("Analysis complete with full document")
             return json.loads(analysis)
             
@@ -330,13 +381,7 @@ def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5):
                 {"role": "user", "content": f"Intermediate Results from Chunks: {chunk_results_str}"}
             ]
             
-            consolidation_response = client.chat.completions.create(
-                model=model,
-                messages=consolidation_messages,
-                response_format={"type": "json_object"}
-            )
-            
-            final_analysis = json.loads(consolidation_response.choices[0].message.content)
+            final_analysis = json.loads(create_chat_completion(consolidation_messages, model, "consolidation"))
             print("Final consolidation complete")
             return final_analysis
             
@@ -377,13 +422,7 @@ def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5):
                     {"role": "user", "content": f"Intermediate Results Batch: {batch_str}"}
                 ]
                 
-                batch_response = client.chat.completions.create(
-                    model=model,
-                    messages=batch_messages,
-                    response_format={"type": "json_object"}
-                )
-                
-                batch_analysis = json.loads(batch_response.choices[0].message.content)
+                batch_analysis = json.loads(create_chat_completion(batch_messages, model, "consolidation"))
                 new_results.append(batch_analysis)
                 print(f"Successfully consolidated batch {i//batch_size + 1}")
             except Exception as batch_error:
@@ -393,6 +432,7 @@ def analyzeDocuments(documents, prompt, model="gpt-4o-mini", max_parallel=5):
         
         # Update results for next iteration
         batched_results = new_results
+        emit("consolidation_progress", remaining_results=len(batched_results))
         
         # If we're down to 3 or fewer results, increase batch size for final consolidation
         if 1 < len(batched_results) <= 3:
@@ -2,6 +2,8 @@ import json
 import os
 import concurrent.futures
 from services.analyzeDocuments import analyzeDocuments
+from services.dag import Stage, run_dag
+from services.progress import propagate_context
 import tiktoken
 from typing import Dict, List, Any, Optional
 
@@ -270,19 +272,30 @@ def analyze_folder(
         # as an individual user message, which is what the analyzeDocuments function expects
         if total_tokens <= available_tokens and len(documents) <= max_files_per_chunk:
             print(f"Analyzing folder '{folder_name}' in a single batch")
-            # Format documents in the way analyzeDocuments expects
-            excel_result = analyze_documents_with_retries(cleaned_documents, system_prompt_excel)
-            doc_result = analyze_documents_with_retries(cleaned_documents, system_prompt_doc)
+            # The Excel and doc passes are independent, so they run side by side.
+            # Each pass gets its own copies since retries may truncate documents in place.
+            results = run_dag([
+                Stage("excel_analysis", lambda inputs: analyze_documents_with_retries(
+                    [dict(doc) for doc in cleaned_documents], system_prompt_excel)),
+                Stage("doc_analysis", lambda inputs: analyze_documents_with_retries(
+                    [dict(doc) for doc in cleaned_documents], system_prompt_doc)),
+            ], max_workers=2, timed=False)
+            excel_result = results["excel_analysis"]
+            doc_result = results["doc_analysis"]
         else:
             print(f"Splitting folder '{folder_name}' into chunks")
             chunks = split_into_chunks(cleaned_documents, max_chunk_tokens, max_files_per_chunk)
             print(f"Created {len(chunks)} chunks for folder '{folder_name}'")
             
-            excel_results = process_chunks_in_parallel(chunks, system_prompt_excel, parallel_jobs, "Excel analysis")
-            doc_results = process_chunks_in_parallel(chunks, system_prompt_doc, parallel_jobs, "Document analysis")
+            results = run_dag([
+                Stage("excel_analysis", lambda inputs: process_chunks_in_parallel(
+                    chunks, system_prompt_excel, parallel_jobs, "Excel analysis")),
+                Stage("doc_analysis", lambda inputs: process_chunks_in_parallel(
+                    chunks, system_prompt_doc, parallel_jobs, "Document analysis")),
+            ], max_workers=2, timed=False)
             
-            excel_result = {"combined_analysis": True, "chunks": excel_results}
-            doc_result = {"combined_analysis": True, "chunks": doc_results}
+            excel_result = {"combined_analysis": True, "chunks": results["excel_analysis"]}
+            doc_result = {"combined_analysis": True, "chunks": results["doc_analysis"]}
         
         folder_result["analysis"]["excel_analysis"] = excel_result
         folder_result["analysis"]["doc_analysis"] = doc_result
@@ -321,7 +334,7 @@ def process_chunks_in_parallel(
     results = []
     with concurrent.futures.ThreadPoolExecutor(max_workers=parallel_jobs) as executor:
         future_to_chunk = {
-            executor.submit(analyze_chunk_with_logging, chunk, system_prompt, i+1, len(chunks), analysis_type): i
+            executor.submit(propagate_context(analyze_chunk_with_logging), chunk, system_prompt, i+1, len(chunks), analysis_type): i
             for i, chunk in enumerate(chunks)
         }
         for future in concurrent.futures.as_completed(future_to_chunk):
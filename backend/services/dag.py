@@ -0,0 +1,112 @@
+import concurrent.futures
+from typing import Any, Callable, Dict, Iterable, List
+
+from services.progress import propagate_context, stage as progress_stage
+
+DAG_MAX_WORKERS = 4  # Nodes of one graph allowed to run at the same time
+
+
+class Stage:
+    """
+    A node of the analysis graph.
+
+    Args:
+        name: Unique name of the node; its result is stored under this name
+        fn: Function called with a dict of {dependency name: dependency result}
+        deps: Names of the nodes that must finish before this one starts
+    """
+
+    def __init__(self, name: str, fn: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = ()):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps!r})"
+
+
+def validate_graph(stages: List[Stage]) -> None:
+    """
+    Check that node names are unique, dependencies exist and there are no cycles.
+
+    Raises:
+        ValueError: If the graph is not a valid DAG
+    """
+    names = [s.name for s in stages]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Duplicate stage names in graph: {names}")
+
+    known = set(names)
+    for s in stages:
+        missing = [dep for dep in s.deps if dep not in known]
+        if missing:
+            raise ValueError(f"Stage '{s.name}' depends on unknown stages: {missing}")
+
+    # Kahn's algorithm: if we cannot order every node, there is a cycle
+    remaining = {s.name: set(s.deps) for s in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Cycle detected between stages: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_dag(stages: List[Stage], max_workers: int = DAG_MAX_WORKERS, timed: bool = True) -> Dict[str, Any]:
+    """
+    Run a graph of stages, starting every node as soon as its dependencies are done.
+
+    Independent nodes run concurrently on a thread pool of max_workers threads.
+    The nodes themselves share the process-wide LLM budget (see
+    services/analyzeDocuments.py), so running them side by side never exceeds
+    the configured number of in-flight OpenAI calls.
+
+    Args:
+        stages: Nodes of the graph
+        max_workers: Maximum number of nodes running at the same time
+        timed: Whether to report each node as a stage on the progress tracker
+
+    Returns:
+        Dict mapping each stage name to its result
+
+    Raises:
+        Exception: The first exception raised by a node; nodes that did not
+                   start yet are cancelled
+    """
+    validate_graph(stages)
+
+    pending = {s.name: s for s in stages}
+    remaining_deps = {s.name: set(s.deps) for s in stages}
+    results: Dict[str, Any] = {}
+
+    def run_node(node: Stage, inputs: Dict[str, Any]) -> Any:
+        if not timed:
+            return node.fn(inputs)
+        with progress_stage(node.name):
+            return node.fn(inputs)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="dag")
+    running: Dict[concurrent.futures.Future, str] = {}
+    try:
+        while pending or running:
+            for name in [name for name in pending if not remaining_deps[name]]:
+                node = pending.pop(name)
+                inputs = {dep: results[dep] for dep in node.deps}
+                running[executor.submit(propagate_context(run_node), node, inputs)] = name
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                for deps in remaining_deps.values():
+                    deps.discard(name)
+    except Exception:
+        for future in running:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+
+    return results
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+EVICTION_BATCH_SIZE = 100  # Entries removed per eviction query
+
+
+class DiskCache:
+    """
+    Persistent key/value cache stored in a single SQLite file.
+
+    Entries are evicted least-recently-used first once the total size of the
+    stored values exceeds max_bytes. Entries may also carry a time-to-live.
+    The cache is safe to share between threads and, through SQLite locking,
+    between processes using the same file.
+
+    Args:
+        path: Location of the SQLite file (its directory is created if needed)
+        max_bytes: Maximum total size of the stored values
+        name: Name used in logs and stats
+    """
+
+    def __init__(self, path: str, max_bytes: int, name: str = "cache"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " expires_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+
+    def get(self, key: str) -> Optional[Union[str, bytes]]:
+        """Return the cached value for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Union[str, bytes], ttl: Optional[float] = None) -> None:
+        """
+        Store value under key, evicting least recently used entries if needed.
+
+        Args:
+            key: Cache key
+            value: Text or bytes to store
+            ttl: Optional time-to-live in seconds
+        """
+        size = len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+        if size > self.max_bytes:
+            print(f"[{self.name}] Entry of {size} bytes exceeds the cache size, not caching it")
+            return
+
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, expires_at)
+            )
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def _evict(self) -> None:
+        # Expired entries go first, then the least recently used ones
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        total = self._total_bytes()
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT ?", (EVICTION_BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                self.evictions += 1
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and the current size of the cache."""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,111 @@
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEDUPLICATE_FILES = True  # Fetch, extract and analyze identical files only once per job
+
+
+def exact_size(size) -> Optional[int]:
+    """
+    Return the byte count of a file server size when it is exact: a number, or
+    a string in bytes ("512 B"). Larger sizes are rounded ("12.30 KB") and
+    cannot tell files apart, so they give None.
+    """
+    if isinstance(size, int) and not isinstance(size, bool):
+        return size
+    if isinstance(size, str):
+        value, _, unit = size.partition(" ")
+        if unit == "B" and value.isdigit():
+            return int(value)
+    return None
+
+
+def metadata_key(rel_path: str, metadata: Dict) -> Optional[Tuple]:
+    """
+    Key under which files reported by the file server are considered copies:
+    same name (case-sensitive), exact byte size and modification date. None
+    when the date is unknown or the size is not exact; such files are always
+    downloaded and only deduplicated by the SHA-256 of their content.
+    """
+    size = exact_size(metadata.get("size"))
+    modified = metadata.get("dateModified")
+    if size is None or modified is None:
+        return None
+    return os.path.basename(rel_path), size, str(modified)
+
+
+def group_by_metadata(file_tuples: List[Tuple[str, Dict]]) -> Tuple[List[Tuple[str, Dict]], Dict[str, List[Tuple[str, Dict]]]]:
+    """
+    Keep one file of every group of likely copies, before anything is downloaded.
+
+    The first path in sorted order is kept, so the choice does not depend on
+    the order of the crawl.
+
+    Returns:
+        tuple: (files to fetch, {kept relative path: [(relative path, metadata) of its copies]})
+    """
+    kept: Dict[Tuple, str] = {}
+    unique: List[Tuple[str, Dict]] = []
+    copies: Dict[str, List[Tuple[str, Dict]]] = {}
+    for rel_path, metadata in sorted(file_tuples, key=lambda item: item[0]):
+        key = metadata_key(rel_path, metadata)
+        if key is not None and key in kept:
+            copies.setdefault(kept[key], []).append((rel_path, metadata))
+            continue
+        if key is not None:
+            kept[key] = rel_path
+        unique.append((rel_path, metadata))
+    return unique, copies
+
+
+class DuplicateIndex:
+    """
+    Content hashes seen by one job.
+
+    Files with the same SHA-256 are extracted once (concurrent requests for the
+    same content wait for the first extraction) and each content is analyzed
+    once per scope (a top-level folder); later copies are recorded as
+    duplicates of the first path.
+    """
+
+    def __init__(self):
+        self._extractions: Dict[str, Future] = {}
+        self._first_paths: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def extract_once(self, sha256: str, extract: Callable[[], str]) -> Tuple[str, bool]:
+        """
+        Return the extracted content of sha256, running extract only for its first file.
+
+        Returns:
+            tuple: (content, whether an earlier extraction was reused)
+        """
+        with self._lock:
+            future = self._extractions.get(sha256)
+            first = future is None
+            if first:
+                future = Future()
+                self._extractions[sha256] = future
+        if not first:
+            return future.result(), True
+        try:
+            content = extract()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(content)
+        return content, False
+
+    def claim(self, scope: str, sha256: Optional[str], path: str) -> Optional[str]:
+        """
+        Register path as holding sha256 in scope.
+
+        Returns:
+            The path registered first for the same content, or None if path is the first
+        """
+        if not sha256:
+            return None
+        with self._lock:
+            first = self._first_paths.setdefault((scope, sha256), path)
+        return None if first == path else first
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from typing import Optional, Tuple
+
+from services.diskCache import DiskCache
+from services.extractContent import EXTRACTOR_VERSION, extractContent, is_extraction_error, ocr_settings
+from services.files import checksum_of
+from services.memoryFile import InMemoryFile
+from services.progress import emit
+
+EXTRACT_CACHE_ENABLED = True
+EXTRACT_CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH", "cache/extracted_text.sqlite")
+EXTRACT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB of extracted text
+HASH_BLOCK_SIZE = 1024 * 1024
+
+extract_cache = DiskCache(EXTRACT_CACHE_PATH, EXTRACT_CACHE_MAX_BYTES, name="extracted_text")
+
+
+def file_digest(file_path: str) -> str:
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extraction_cache_key(file_path) -> str:
+    """
+    Build the cache key of a file: extractor version, OCR settings, file type
+    and content hash.
+
+    The file name is deliberately not part of the key, so the same document
+    stored under different names or folders is extracted only once.
+    """
+    extension = os.path.splitext(str(file_path))[1].lower()
+    # Reuse the hash computed while the file was downloaded
+    if isinstance(file_path, InMemoryFile):
+        digest = file_path.sha256 or hashlib.sha256(file_path.data).hexdigest()
+    else:
+        digest = checksum_of(file_path) or file_digest(file_path)
+    return f"{EXTRACTOR_VERSION}:{ocr_settings()}:{extension}:{digest}"
+
+
+def lookup_extraction(file_path) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Look up a previous extraction of the same bytes.
+
+    Returns:
+        tuple: (cache key, or None when the cache is off or unavailable; cached content or None)
+    """
+    if not EXTRACT_CACHE_ENABLED:
+        return None, None
+
+    try:
+        key = extraction_cache_key(file_path)
+        cached = extract_cache.get(key)
+    except Exception as e:
+        print(f"Extraction cache unavailable for {file_path}: {str(e)}")
+        return None, None
+
+    if cached is not None:
+        print(f"Extraction cache hit: {file_path}")
+        emit("extract_cache_hit", counters={"extract_cache_hits": 1}, file=str(file_path))
+        return key, cached
+
+    emit("extract_cache_miss", counters={"extract_cache_misses": 1}, file=str(file_path))
+    return key, None
+
+
+def store_extraction(key: Optional[str], file_path, content: str) -> None:
+    """Cache a fresh extraction under the key returned by lookup_extraction."""
+    # Empty results and error texts are not cached: they may come from a transient extraction error
+    if key is None or is_extraction_error(content):
+        return
+    try:
+        extract_cache.set(key, content)
+    except Exception as e:
+        print(f"Could not store extraction of {file_path} in cache: {str(e)}")
+
+
+def extract_content_cached(file_path) -> str:
+    """
+    Extract the content of a file, reusing a previous extraction of the same bytes.
+
+    Args:
+        file_path: Path of the downloaded file, or the file as an InMemoryFile
+
+    Returns:
+        The extracted content (same as extractContent)
+    """
+    key, cached = lookup_extraction(file_path)
+    if cached is not None:
+        return cached
+    content = extractContent(file_path)
+    store_extraction(key, file_path, content)
+    return content
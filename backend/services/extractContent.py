@@ -1,25 +1,69 @@
 from services.transcribe import transcribe_audio_file
 from pypdf import PdfReader
 import pandas as pd
+import atexit
+import importlib
+import importlib.util
 import io
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import fitz  # PyMuPDF
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_bytes, convert_from_path
 from PIL import Image
+from services.memoryFile import InMemoryFile
+from services.ocrCache import lookup_page_text, page_cache_key, store_page_text
+from services.ocrPreprocessing import OCR_PREPROCESS, OCR_TARGET_DPI, preprocess_page
+from services.progress import ProgressTracker, emit, tracking
 
-def extractContent(file_path: str):
+EXTRACTOR_VERSION = "5"  # Bump whenever the extracted output changes, to invalidate cached extractions
+EXCEL_ERROR_PREFIX = "Error extracting Excel content from "  # Excel failures are returned as text starting with this
+# "fitz" renders pages from the already open PyMuPDF document; "pdf2image" runs poppler's pdftoppm per batch
+OCR_RENDERER = os.getenv("OCR_RENDERER", "fitz")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))  # Resolution pages are rendered at for OCR
+# Capped at OCR_TARGET_DPI: the renderer sets the resolution, so no page is rendered larger than tesseract needs
+OCR_RENDER_DPI = min(OCR_DPI, OCR_TARGET_DPI) if OCR_TARGET_DPI > 0 else OCR_DPI
+OCR_GRAYSCALE = True  # Render fitz pages as 8-bit grayscale (a third of the RGB size; tesseract binarizes anyway)
+OCR_BATCH_PAGES = 4  # Consecutive pages rendered together (first_page/last_page)
+# Page batches OCR'd at the same time per process; tesseract runs outside the GIL (C API or its own process), so
+# threads use all cores. Extraction pool workers default to their share of the cores (configure_pool_worker)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+# Rendered page images held at once, split between the extraction pool workers
+OCR_MAX_RENDERED_BYTES = int(os.getenv("OCR_MAX_RENDERED_BYTES", str(256 * 1024 * 1024)))
+
+# "tesserocr" keeps one tesseract instance loaded per OCR thread; "pytesseract" starts the tesseract command per page
+OCR_ENGINE = os.getenv("OCR_ENGINE", "tesserocr")
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+# The tesseract C API binding is optional; without it OCR falls back to pytesseract
+TESSEROCR_AVAILABLE = importlib.util.find_spec("tesserocr") is not None
+
+_ocr_executor = None
+_ocr_seconds_per_page = None  # Moving average of the OCR time of a page in this process
+_ocr_executor_lock = threading.Lock()
+# PyMuPDF objects must not be used by several threads at once
+_fitz_lock = threading.Lock()
+
+def extractContent(file_path):
+    """
+    Extract the content of a file given by its path or as an InMemoryFile.
+    """
     print("Extracting content from file:", file_path)
+    path = str(file_path)
     
     try:
-        if file_path.endswith(".pdf"):
+        if path.endswith(".pdf"):
             return extract_text_from_pdf(file_path)
-        elif file_path.endswith(".xlsx") or file_path.endswith(".xls"):
+        elif path.endswith(".xlsx") or path.endswith(".xls"):
             return extract_excel_content(file_path)
-        elif file_path.lower().endswith(('.mp3', '.mp4', '.wav', '.ogg', '.m4a', 
+        elif path.lower().endswith(('.mp3', '.mp4', '.wav', '.ogg', '.m4a', 
                           '.flac', '.aac', '.wma', '.amr', '.aiff', 
                           '.opus', '.webm', '.avi', '.mov', '.mkv')):
             # Use the transcription helper function
+            if isinstance(file_path, InMemoryFile):
+                return _transcribe_in_memory(file_path)
             return transcribe_audio_file(file_path)
         else:
             print(f"Warning: Unsupported file format for file {file_path}. Skipping extraction.")
@@ -28,6 +72,50 @@ def extractContent(file_path: str):
         print(f"Error extracting content from {file_path}: {str(e)}")
         return ""
 
+def ocr_settings() -> str:
+    """
+    Return the settings the text of OCR'd pages depends on besides
+    EXTRACTOR_VERSION, for the keys of cached extractions and analyses.
+
+    The engine is the one actually in use, not OCR_ENGINE: without a working
+    tesserocr, pages are OCR'd by pytesseract and must not be cached as
+    tesserocr output.
+    """
+    engine = get_ocr_engine().name
+    return f"{OCR_DPI}:{OCR_RENDERER}:{engine}:{OCR_LANGUAGE}:{OCR_PREPROCESS}:{OCR_TARGET_DPI}"
+
+
+def is_extraction_error(content) -> bool:
+    """Whether content is missing or the error text of a failed extraction, which may be transient."""
+    return not isinstance(content, str) or not content.strip() or content.startswith(EXCEL_ERROR_PREFIX)
+
+def extract_with_metrics(file_path):
+    """
+    Run extractContent on a fresh progress tracker, for worker processes
+    where the tracker of the run is not available.
+
+    Returns:
+        tuple: (extracted content, recorded events without their sequence and timing fields, counter totals)
+    """
+    tracker = ProgressTracker()
+    with tracking(tracker):
+        content = extractContent(file_path)
+    events = [
+        {key: value for key, value in event.items() if key not in ("seq", "time", "elapsed")}
+        for event in tracker.events_since(0)
+    ]
+    return content, events, tracker.counters
+
+def _transcribe_in_memory(file: InMemoryFile):
+    # The transcription service uploads from a path
+    suffix = os.path.splitext(file.path)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(file.data)
+    try:
+        return transcribe_audio_file(f.name)
+    finally:
+        os.remove(f.name)
+
 def extractExcelContent(file_path: str):
     try:
         text = ""
@@ -58,25 +146,391 @@ def extractPdfContent(file_path: str):
         print(f"Error extracting PDF content from {file_path}: {str(e)}")
         return ""
     
-def extract_text_from_pdf(pdf_path: str):
-    text = ""
-    doc = fitz.open(pdf_path)
-    
-    for page in doc:
-        text += page.get_text("text")  # Extract text directly
-    
-    if text.strip():  
-        return text  # Return extracted text if available
+class RenderBudget:
+    """Bytes of rendered page images that may exist at once, shared by all OCR batches of the process."""
 
-    # If no text, perform OCR on images
-    images = convert_from_path(pdf_path)  
-    ocr_text = "\n".join([pytesseract.image_to_string(img) for img in images])
-    
-    return ocr_text
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self._cond:
+            # A batch larger than the whole budget still runs, alone
+            while self.used and self.used + nbytes > self.limit:
+                self._cond.wait()
+            self.used += nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+
+_render_budget = RenderBudget(OCR_MAX_RENDERED_BYTES)
+
+
+def configure_pool_worker(processes):
+    """
+    Size OCR for one of `processes` extraction worker processes, before its
+    first page is OCR'd. Every worker has its own OCR threads and render
+    budget, so unless OCR_WORKERS is set each gets its share of the cores
+    rather than all of them, and OCR_MAX_RENDERED_BYTES is split between them.
+    The tesserocr instances are freed when the worker exits.
+    """
+    global OCR_WORKERS
+    processes = max(1, processes)
+    if "OCR_WORKERS" not in os.environ:
+        OCR_WORKERS = max(1, (os.cpu_count() or 2) // processes)
+    _render_budget.limit = max(1, OCR_MAX_RENDERED_BYTES // processes)
+    atexit.register(shutdown_ocr)
+
+
+def _get_ocr_executor():
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+        return _ocr_executor
+
+
+def page_batches(page_numbers, batch_size=OCR_BATCH_PAGES):
+    """
+    Group 1-based page numbers into runs of consecutive pages of at most
+    batch_size pages, returned as (first_page, last_page) tuples.
+    """
+    batches = []
+    for number in sorted(page_numbers):
+        if batches and number == batches[-1][1] + 1 and number - batches[-1][0] < batch_size:
+            batches[-1] = (batches[-1][0], number)
+        else:
+            batches.append((number, number))
+    return batches
+
+
+def _rendered_bytes(doc, first_page, last_page, dpi, channels):
+    # Pixels of the pages at dpi; page sizes are in points (1/72 inch)
+    scale = dpi / 72
+    return sum(
+        int(doc[number - 1].rect.width * scale) * int(doc[number - 1].rect.height * scale) * channels
+        for number in range(first_page, last_page + 1)
+    )
+
+
+def _render_channels(renderer=None, grayscale=OCR_GRAYSCALE):
+    return 1 if (renderer or OCR_RENDERER) == "fitz" and grayscale else 3
+
+
+def render_pages_fitz(doc, first_page, last_page, dpi=OCR_RENDER_DPI, grayscale=OCR_GRAYSCALE):
+    """
+    Rasterize 1-based pages of an open PyMuPDF document, without a poppler
+    subprocess or a PNG/PPM encode/decode step: the images wrap the raw pixmap samples.
+
+    Returns:
+        list: PIL images in mode "L" (grayscale) or "RGB"
+    """
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    mode = "L" if grayscale else "RGB"
+    with _fitz_lock:
+        pixmaps = [
+            doc[number - 1].get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+            for number in range(first_page, last_page + 1)
+        ]
+    return [
+        Image.frombuffer(mode, (pixmap.width, pixmap.height), pixmap.samples, "raw", mode, pixmap.stride, 1)
+        for pixmap in pixmaps
+    ]
+
+
+def render_pages_pdf2image(pdf_path, first_page, last_page, dpi=OCR_RENDER_DPI):
+    """Rasterize 1-based pages with poppler (pdftoppm subprocess), in color."""
+    if isinstance(pdf_path, InMemoryFile):
+        return convert_from_bytes(pdf_path.data, dpi=dpi, first_page=first_page, last_page=last_page)
+    return convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+
+
+def render_pages(pdf_path, doc, first_page, last_page):
+    """Rasterize 1-based pages for OCR with the configured OCR_RENDERER."""
+    if OCR_RENDERER == "fitz":
+        return render_pages_fitz(doc, first_page, last_page)
+    return render_pages_pdf2image(pdf_path, first_page, last_page)
+
+
+class PytesseractEngine:
+    """Runs the tesseract command on every page, which loads the language model each time."""
+
+    name = "pytesseract"
+
+    def recognize(self, image, dpi=OCR_RENDER_DPI):
+        return pytesseract.image_to_string(image, lang=OCR_LANGUAGE, config=f"--dpi {dpi}")
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """
+    Tesseract through its C API (tesserocr). Up to max_instances instances
+    (OCR_WORKERS by default, one per OCR thread of the process) are created on
+    first use and kept loaded with the language model; each page borrows one
+    for the time it is recognized. The API releases the GIL while it
+    recognizes a page. close() frees them.
+
+    Grayscale pages are passed as raw 8-bit pixels with SetImageBytes, so no
+    image file is written or decoded.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, max_instances=None):
+        # Tesseract's own OpenMP threads only compete with the OCR threads
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        self._tesserocr = importlib.import_module("tesserocr")
+        self._max_instances = max(1, max_instances or OCR_WORKERS)
+        self._idle = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        # Fails here, not on the first page, when the language data is missing
+        self._release(self._acquire())
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._created >= self._max_instances:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self._tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE, psm=self._tesserocr.PSM.AUTO)
+        except BaseException:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, api):
+        with self._cond:
+            if self._closed:
+                self._created -= 1
+                api.End()
+            else:
+                self._idle.append(api)
+            self._cond.notify()
+
+    def recognize(self, image, dpi=OCR_RENDER_DPI):
+        api = self._acquire()
+        try:
+            if image.mode == "L":
+                api.SetImageBytes(image.tobytes(), image.width, image.height, 1, image.width)
+            else:
+                api.SetImage(image)
+            api.SetSourceResolution(dpi)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._release(api)
+
+    def close(self):
+        """Free the tesseract instances; those still recognizing a page are freed when it is done."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for api in idle:
+            api.End()
+
+
+_ocr_engine = None
+_ocr_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """
+    Return the OCR engine of this process, selected by OCR_ENGINE.
+
+    The persistent tesserocr engine is used when tesserocr is installed and
+    starts; otherwise pages are OCR'd with pytesseract.
+    """
+    global _ocr_engine
+    with _ocr_engine_lock:
+        if _ocr_engine is None:
+            if OCR_ENGINE == "tesserocr" and TESSEROCR_AVAILABLE:
+                try:
+                    _ocr_engine = TesserocrEngine()
+                except Exception as e:
+                    print(f"Could not start tesserocr, falling back to pytesseract: {str(e)}")
+            elif OCR_ENGINE == "tesserocr":
+                print("tesserocr is not installed, OCR runs the tesseract command per page")
+            if _ocr_engine is None:
+                _ocr_engine = PytesseractEngine()
+        return _ocr_engine
+
+
+def shutdown_ocr():
+    """
+    Stop the OCR threads of this process and free its OCR engine (the
+    tesserocr instances). OCR started afterwards starts them again.
+    """
+    global _ocr_executor, _ocr_engine
+    with _ocr_executor_lock:
+        executor, _ocr_executor = _ocr_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+    with _ocr_engine_lock:
+        engine, _ocr_engine = _ocr_engine, None
+    if engine is not None:
+        engine.close()
+
+
+def _ocr_batch(pdf_path, doc, first_page, last_page, nbytes):
+    """
+    Render, preprocess and OCR one batch of pages.
+
+    Returns:
+        tuple: (text of every page, counters of the batch)
+    """
+    counters = {"ocr_seconds": 0.0, "ocr_pages_recognized": 0, "ocr_cache_hits": 0}
+    _render_budget.acquire(nbytes)
+    try:
+        # Only this batch is rendered, right before it is OCR'd
+        images = render_pages(pdf_path, doc, first_page, last_page)
+        try:
+            engine = get_ocr_engine()
+            texts = []
+            for image in images:
+                page, dpi = image, OCR_RENDER_DPI
+                if OCR_PREPROCESS:
+                    page, stats = preprocess_page(image, OCR_RENDER_DPI)
+                    _add_preprocess_counters(counters, stats)
+                    if page is None:
+                        texts.append("")
+                        continue
+                    dpi = stats["dpi"]
+                try:
+                    # Recurring pages (signatures, covers, disclaimers) are OCR'd once across documents and runs
+                    key = page_cache_key(page, f"{EXTRACTOR_VERSION}:{engine.name}:{OCR_LANGUAGE}:{dpi}")
+                    text = lookup_page_text(key)
+                    if text is not None:
+                        counters["ocr_cache_hits"] += 1
+                    else:
+                        started = time.perf_counter()
+                        text = engine.recognize(page, dpi)
+                        counters["ocr_seconds"] += time.perf_counter() - started
+                        counters["ocr_pages_recognized"] += 1
+                        store_page_text(key, text)
+                finally:
+                    if page is not image:
+                        page.close()
+                texts.append(text)
+            return texts, counters
+        finally:
+            for image in images:
+                image.close()
+    finally:
+        _render_budget.release(nbytes)
+
+
+def _add_preprocess_counters(counters, stats):
+    for name, value in (
+        ("ocr_preprocess_seconds", stats["seconds"]),
+        ("ocr_pages_blank_skipped", int(stats["blank"])),
+        ("ocr_pages_deskewed", int(bool(stats["skew"]))),
+        ("ocr_pixels_rendered", stats["pixels_in"]),
+        ("ocr_pixels_recognized", 0 if stats["blank"] else stats["pixels_out"]),
+    ):
+        counters[name] = counters.get(name, 0) + value
+
+
+def _emit_ocr_metrics(pdf_path, counters):
+    """
+    Report the OCR time of a document and what preprocessing and the page
+    cache saved: blank pages skipped and cached pages are valued at the
+    average OCR time of a page in this process.
+    """
+    global _ocr_seconds_per_page
+    if counters["ocr_pages_recognized"]:
+        per_page = counters["ocr_seconds"] / counters["ocr_pages_recognized"]
+        _ocr_seconds_per_page = per_page if _ocr_seconds_per_page is None else 0.8 * _ocr_seconds_per_page + 0.2 * per_page
+    skipped = counters.get("ocr_pages_blank_skipped", 0) + counters["ocr_cache_hits"]
+    if skipped and _ocr_seconds_per_page is not None:
+        counters["ocr_seconds_saved"] = skipped * _ocr_seconds_per_page
+    counters = {name: round(value, 3) if isinstance(value, float) else value for name, value in counters.items()}
+    emit("ocr_metrics", counters=counters, file=str(pdf_path),
+         blank_pages=counters.get("ocr_pages_blank_skipped", 0), deskewed_pages=counters.get("ocr_pages_deskewed", 0),
+         cached_pages=counters["ocr_cache_hits"])
+
+
+def ocr_pages(pdf_path, doc, page_numbers):
+    """
+    OCR the given 1-based pages of a PDF.
+
+    Pages are rendered lazily in batches of OCR_BATCH_PAGES consecutive pages,
+    and up to OCR_WORKERS batches are OCR'd in parallel as long as their
+    rendered images fit in the render budget of the process. With OCR_PREPROCESS, pages
+    are cleaned up first and blank pages come back as empty text. Pages
+    already in the OCR cache are not OCR'd again.
+
+    Returns:
+        dict: OCR text by page number
+    """
+    executor = _get_ocr_executor()
+    # Page sizes are read before the first batch renders on an OCR thread, as doc is not thread-safe
+    estimates = {
+        (first, last): _rendered_bytes(doc, first, last, OCR_RENDER_DPI, _render_channels())
+        for first, last in page_batches(page_numbers)
+    }
+    futures = {
+        (first, last): executor.submit(_ocr_batch, pdf_path, doc, first, last, nbytes)
+        for (first, last), nbytes in estimates.items()
+    }
+    texts = {}
+    counters = {}
+    for (first, last), future in futures.items():
+        batch_texts, batch_counters = future.result()
+        for number, text in zip(range(first, last + 1), batch_texts):
+            texts[number] = text
+        for name, value in batch_counters.items():
+            counters[name] = counters.get(name, 0) + value
+    _emit_ocr_metrics(pdf_path, counters)
+    return texts
+
+
+def extract_text_from_pdf(pdf_path):
+    """
+    Extract the text of a PDF page by page. Pages without a text layer that
+    contain images (scanned pages) or vector drawings (outlined text, vector
+    scans, flattened forms) are OCR'd; the text of the other pages is used as
+    it is, so a text deck with a scanned appendix keeps both.
+    """
+    in_memory = isinstance(pdf_path, InMemoryFile)
+    doc = fitz.open(stream=pdf_path.data, filetype="pdf") if in_memory else fitz.open(pdf_path)
+    try:
+        page_texts = []
+        scanned_pages = []
+        for number, page in enumerate(doc, start=1):
+            page_text = page.get_text("text")  # Extract text directly
+            page_texts.append(page_text)
+            # get_drawings is only asked for text-less pages without images, as it walks the whole page
+            if not page_text.strip() and (page.get_images() or page.get_drawings()):
+                scanned_pages.append(number)
+        emit("pages_extracted", counters={"pages_extracted": len(doc)}, file=str(pdf_path), pages=len(doc))
+
+        if scanned_pages:
+            ocr_texts = ocr_pages(pdf_path, doc, scanned_pages)
+            for number, ocr_text in ocr_texts.items():
+                page_texts[number - 1] = ocr_text.rstrip("\f") + "\n"
+            emit("pages_ocr", counters={"pages_ocr": len(ocr_texts)}, file=str(pdf_path), pages=len(ocr_texts),
+                 text_pages=len(doc) - len(scanned_pages), engine=get_ocr_engine().name)
+    finally:
+        doc.close()
+
+    return "".join(page_texts)
 
-def extract_excel_content(file_path: str) -> str:
+def extract_excel_content(file_path) -> str:
     try:
-        excel_file = pd.ExcelFile(file_path, engine="openpyxl")  # Efficient for .xlsx
+        source = file_path.open() if isinstance(file_path, InMemoryFile) else file_path
+        excel_file = pd.ExcelFile(source, engine="openpyxl")  # Efficient for .xlsx
 
         with io.StringIO() as buffer:
             for sheet_name in excel_file.sheet_names:
@@ -91,4 +545,4 @@ def extract_excel_content(file_path: str) -> str:
             return buffer.getvalue()  # Get full extracted content
 
     except Exception as e:
-        return f"Error extracting Excel content from {file_path}: {str(e)}"
\ No newline at end of file
+        return f"{EXCEL_ERROR_PREFIX}{file_path}: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, List, Optional
+
+from services.extractCache import lookup_extraction, store_extraction
+from services.extractContent import configure_pool_worker, extract_with_metrics
+from services.progress import emit
+
+PROCESS_POOL_EXTRACTION = True  # Extract in worker processes, one per core, instead of threads of this process
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", str(os.cpu_count() or 2)))
+EXTRACTION_READ_AHEAD = 2  # Files extracted ahead of the writer, per worker process
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _start_worker(processes: int) -> None:
+    # Runs in each worker process once it imported this module and with it the extractors
+    configure_pool_worker(processes)
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """
+    Return the shared extraction process pool, starting it on first use.
+
+    Workers are spawned (not forked) so they do not inherit the locks and
+    threads of the server process, and import the extractors (PyMuPDF,
+    pandas, tesseract bindings) as soon as they start. Each sizes its OCR
+    threads and render budget to its share of the machine.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start_worker,
+                initargs=(EXTRACTION_PROCESSES,)
+            )
+        return _pool
+
+
+def warm_extraction_pool() -> None:
+    """
+    Start every worker process and load the extraction libraries in it, so the
+    first analysis does not pay for process start-up. Blocks until all workers are up.
+    """
+    if not PROCESS_POOL_EXTRACTION:
+        return
+    pool = get_extraction_pool()
+    pids = {future.result() for future in [pool.submit(os.getpid) for _ in range(EXTRACTION_PROCESSES)]}
+    print(f"Extraction pool ready with {len(pids)} worker processes")
+
+
+def worker_pids() -> List[int]:
+    """Return the process ids of the running extraction workers (none before the pool started)."""
+    with _pool_lock:
+        pool = _pool
+    if pool is None:
+        return []
+    # ProcessPoolExecutor keeps its workers by pid; the dict is replaced on shutdown
+    return list(dict(pool._processes or {}))
+
+
+def shutdown_extraction_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _reset_broken_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _finish(key, file_path, result) -> str:
+    content, events, counters = result
+    for event in events:
+        name = event.pop("event")
+        emit(name, **event)
+    if counters:
+        emit("extraction_metrics", counters=counters, file=str(file_path))
+    store_extraction(key, file_path, content)
+    return content
+
+
+class PendingExtraction:
+    """
+    Extraction started by submit_extraction. result() waits for it, replays the
+    events recorded by the worker on the current progress tracker and caches
+    the content, so call it on a thread of the run.
+    """
+
+    def __init__(self, file_path, key: Optional[str] = None, worker_future: Optional[Future] = None,
+                 pool: Optional[ProcessPoolExecutor] = None, content: Optional[str] = None):
+        self._file_path = file_path
+        self._key = key
+        self._worker_future = worker_future
+        self._pool = pool
+        self._content = content
+
+    def result(self) -> str:
+        if self._worker_future is not None:
+            try:
+                outcome = self._worker_future.result()
+            except Exception as e:
+                # e.g. a worker killed for memory: extract this file here instead
+                print(f"Extraction of {self._file_path} failed in the process pool, extracting in process: {str(e)}")
+                if isinstance(e, BrokenProcessPool):
+                    _reset_broken_pool(self._pool)
+                outcome = extract_with_metrics(self._file_path)
+            self._content = _finish(self._key, self._file_path, outcome)
+            self._worker_future = None
+        return self._content
+
+
+def submit_extraction(file_path) -> PendingExtraction:
+    """
+    Start extracting a file (path or InMemoryFile).
+
+    Cached extractions are returned right away; other files are extracted in
+    the process pool (or in this process when PROCESS_POOL_EXTRACTION is off).
+    """
+    key, cached = lookup_extraction(file_path)
+    if cached is not None:
+        return PendingExtraction(file_path, content=cached)
+    if not PROCESS_POOL_EXTRACTION:
+        return PendingExtraction(file_path, content=_finish(key, file_path, extract_with_metrics(file_path)))
+
+    pool = get_extraction_pool()
+    try:
+        worker_future = pool.submit(extract_with_metrics, file_path)
+    except BrokenProcessPool:
+        _reset_broken_pool(pool)
+        pool = get_extraction_pool()
+        worker_future = pool.submit(extract_with_metrics, file_path)
+    return PendingExtraction(file_path, key, worker_future, pool)
+
+
+def extract_content_pooled(file_path) -> str:
+    """Extract one file through the cache and the process pool, blocking until it is done."""
+    return submit_extraction(file_path).result()
+
+
+def extract_in_order(file_paths: Iterable) -> Iterator[str]:
+    """
+    Yield the extracted content of every file, in the given order.
+
+    Up to EXTRACTION_PROCESSES * EXTRACTION_READ_AHEAD files are extracted
+    ahead of the consumer, so all cores are busy while results are still
+    consumed (and written) strictly in order, with bounded memory.
+    """
+    paths = iter(file_paths)
+    pending: deque = deque()
+    window = max(1, EXTRACTION_PROCESSES * EXTRACTION_READ_AHEAD)
+
+    def fill() -> None:
+        while len(pending) < window:
+            path = next(paths, None)
+            if path is None:
+                return
+            pending.append(submit_extraction(path))
+
+    fill()
+    while pending:
+        future = pending.popleft()
+        fill()
+        yield future.result()
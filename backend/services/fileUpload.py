@@ -1,8 +1,9 @@
 import os
 import json
-import requests
 from datetime import datetime
 
+from services.httpClient import http_pool
+
 def create_folder_and_upload_files(file_paths, folder_name='docOutput'):
     """
     Creates a folder and uploads files to the server
@@ -48,10 +49,11 @@ def create_folder_and_upload_files(file_paths, folder_name='docOutput'):
         create_folder_headers = headers.copy()
         create_folder_headers['Content-Type'] = 'application/json'
         
-        create_response = requests.post(
+        create_response = http_pool.post(
             server_url + '/',
             headers=create_folder_headers,
-            data=json.dumps(create_folder_data)
+            content=json.dumps(create_folder_data),
+            retries=0
         )
         
         print(f"Create folder response: {create_response.status_code}")
@@ -78,11 +80,6 @@ def create_folder_and_upload_files(file_paths, folder_name='docOutput'):
                 "_fm_id": "fe_tree"
             }
             
-            # Prepare the multipart form data
-            files = {
-                'uploadFiles': (file_name, open(file_path, 'rb'), 'application/octet-stream')
-            }
-            
             upload_data = {
                 'path': f"/{folder_name}/",
                 'size': str(file_size),
@@ -91,12 +88,19 @@ def create_folder_and_upload_files(file_paths, folder_name='docOutput'):
                 'filename': file_name
             }
             
-            upload_response = requests.post(
-                server_url + '/Upload',
-                headers=headers,
-                files=files,
-                data=upload_data
-            )
+            # Prepare the multipart form data; uploads are not retried since the
+            # file stream is consumed by the first attempt
+            with open(file_path, 'rb') as upload_file:
+                files = {
+                    'uploadFiles': (file_name, upload_file, 'application/octet-stream')
+                }
+                upload_response = http_pool.post(
+                    server_url + '/Upload',
+                    headers=headers,
+                    files=files,
+                    data=upload_data,
+                    retries=0
+                )
             
             print(f"File upload response for {file_name}: {upload_response.status_code}")
             print(upload_response.text)
@@ -1,13 +1,40 @@
 import os
+import base64
+import shutil
+import hashlib
 import tempfile
-import requests
 import json
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from urllib.parse import quote
+import threading
+import zipfile
+import itertools
 import concurrent.futures
+import httpx
+from services.adaptiveConcurrency import AdaptiveConcurrencyLimiter
+from services.duplicates import DEDUPLICATE_FILES, group_by_metadata
+from services.httpClient import http_pool
+from services.memoryFile import InMemoryFile, SpillBuffer
+from services.progress import emit, propagate_context
 
-fileServer = "https://company-analysis-y7dw.onrender.com"
+fileServer = os.getenv("FILE_SERVER_URL", "https://company-analysis-y7dw.onrender.com")
 UPLOAD_DIR = "temp_uploads"
-MAX_CONCURRENT_DOWNLOADS = 5  # Set the maximum number of concurrent downloads
+# Upper bound of the concurrent downloads of one job; the actual number is tuned while downloading
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "10"))
+MAX_GLOBAL_DOWNLOADS = 20  # Downloads in flight across all concurrent analyses
+ADAPTIVE_DOWNLOADS = True  # Tune the concurrent downloads of a job on throughput, latency and errors
+INITIAL_CONCURRENT_DOWNLOADS = 4  # Concurrent downloads a job starts with
+MAX_JOB_DOWNLOAD_BYTES = int(os.getenv("MAX_JOB_DOWNLOAD_BYTES", str(20 * 1024 ** 3)))  # Bytes one job may download
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes written to disk at a time
+DOWNLOAD_RESUME_ATTEMPTS = 3  # Range requests after an interrupted download
+DOWNLOAD_RESUME_BACKOFF_SECONDS = 1
+BULK_DOWNLOADS = True  # Fetch several files of a directory as one zip archive
+ARCHIVE_BATCH_MAX_FILES = 50  # Files requested in one archive
+ARCHIVE_BATCH_MAX_BYTES = 256 * 1024 * 1024  # Reported bytes requested in one archive
+IN_MEMORY_DOWNLOADS = False  # Hand downloaded files to the extractors as bytes instead of writing them to disk
+IN_MEMORY_MAX_BYTES = 32 * 1024 * 1024  # Larger files are written to the workspace as usual
 
 # Define file extensions to skip (audio and video files)
 SKIP_EXTENSIONS = [
@@ -17,13 +44,27 @@ SKIP_EXTENSIONS = [
     '.mp3', '.wav', '.ogg', '.aac', '.flac', '.m4a', '.wma', '.aiff', '.alac'
 ]
 
+_download_slots = threading.BoundedSemaphore(MAX_GLOBAL_DOWNLOADS)
+
+# Metadata reported by the file server for every file seen while crawling, keyed by relative path
+DETAIL_FIELDS = ("size", "dateModified", "dateCreated")
+file_details = {}
+# SHA-256 computed while downloading, keyed by local path: (size, mtime_ns, sha256)
+downloaded_checksums = {}
+
+_download_budget = ContextVar("download_budget", default=None)
+_download_limiter = ContextVar("download_limiter", default=None)
+# The file server builds every archive in the same ./Files.zip, so archive requests must not overlap
+_archive_lock = threading.Lock()
+_archive_ids = itertools.count()
+
 # Ensure the upload directory exists
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
 
 def fetchFiles(path):
-    response = requests.post(fileServer, json={
+    response = http_pool.post(fileServer, json={
         "action": "read",
         "path": path,
         "showHiddenItems": False,
@@ -35,12 +76,20 @@ def fetchFiles(path):
     return data["files"]
 
 
+def normalize_path(path):
+    """Collapse duplicate slashes: '//Alpine VC/' -> '/Alpine VC'."""
+    return "/" + "/".join(part for part in path.split("/") if part)
+
+
 def traverse_path(path):
     files = fetchFiles(path)
     tree = []
     for item in files:
         if item["isFile"]:
             tree.append(item["name"])
+            file_details[normalize_path(path + "/" + item["name"])] = {
+                field: item.get(field) for field in DETAIL_FIELDS
+            }
         else:
             subtree = traverse_path(path + "/" + item["name"])
             if subtree:
@@ -87,6 +136,7 @@ def get_all_files(files, current_path=""):
     Recursively search the directory tree to build full relative paths
     for all files and return them in an array with metadata.
     Each element in the returned list is a tuple: (relative_path, metadata)
+    Size and modification date are included when the file was seen by a crawl.
     """
     all_files = []
     for item in files:
@@ -102,14 +152,226 @@ def get_all_files(files, current_path=""):
                 "filterPath": current_path + "/",
                 "type": os.path.splitext(item)[1]
             }
+            metadata.update(file_details.get(file_relative_path, {}))
             all_files.append((file_relative_path, metadata))
     return all_files
 
-def download_single_file(rel_path, metadata, base_folder):
+class DownloadBudgetExceeded(Exception):
+    """Raised when a job would download more than its byte budget."""
+
+
+class DownloadVerificationError(Exception):
+    """Raised when a downloaded file does not match its expected size or checksum."""
+
+
+class DownloadBudget:
+    """Bytes a job may still download, shared by all of its download threads."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def check(self, expected_bytes):
+        """Fail early when a file of known size cannot fit in the remaining budget."""
+        with self._lock:
+            if self.used + expected_bytes > self.limit:
+                raise DownloadBudgetExceeded(
+                    f"Download budget of {self.limit} bytes exceeded ({self.used} used, {expected_bytes} needed)"
+                )
+
+    def consume(self, received_bytes):
+        with self._lock:
+            self.used += received_bytes
+            if self.used > self.limit:
+                raise DownloadBudgetExceeded(f"Download budget of {self.limit} bytes exceeded")
+
+
+@contextmanager
+def download_budget(limit=MAX_JOB_DOWNLOAD_BYTES):
+    """
+    Give the downloads made inside the block a shared byte budget.
+
+    Nested blocks (e.g. the directories of a batch job) share the outer budget.
+    """
+    budget = _download_budget.get()
+    if budget is not None:
+        yield budget
+        return
+    token = _download_budget.set(DownloadBudget(limit))
+    try:
+        yield _download_budget.get()
+    finally:
+        _download_budget.reset(token)
+
+
+@contextmanager
+def download_concurrency(max_limit=MAX_CONCURRENT_DOWNLOADS):
+    """
+    Tune the number of concurrent downloads made inside the block, between 1
+    and max_limit, with an AIMD limiter (services/adaptiveConcurrency.py).
+    Callers can run up to max_limit download threads; the limiter admits as
+    many as the file server currently handles well. The chosen limit is
+    reported as the "download_concurrency" gauge of the run.
+
+    Nested blocks share the outer limiter. Yields None when ADAPTIVE_DOWNLOADS is off.
+    """
+    limiter = _download_limiter.get()
+    if limiter is not None or not ADAPTIVE_DOWNLOADS:
+        yield limiter
+        return
+    limiter = AdaptiveConcurrencyLimiter("download_concurrency", max_limit, INITIAL_CONCURRENT_DOWNLOADS)
+    token = _download_limiter.set(limiter)
+    try:
+        yield limiter
+    finally:
+        _download_limiter.reset(token)
+        emit("download_concurrency_summary", **limiter.stats())
+
+
+@contextmanager
+def _download_slot():
+    # Outcome of a download as seen by the job's limiter, or a throwaway dict without one
+    limiter = _download_limiter.get()
+    if limiter is None:
+        yield {"ok": True, "bytes": 0, "seconds": None}
+        return
+    with limiter.slot() as outcome:
+        yield outcome
+
+
+def format_size(size):
+    """Format a byte count like the file server does ("512 B", "12.30 KB", "1.50 MB")."""
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.2f} KB"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f} MB"
+    return f"{size / 1024 / 1024 / 1024:.2f} GB"
+
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def _split_size(size):
+    try:
+        value, unit = size.split()
+        return float(value), SIZE_UNITS[unit.upper()]
+    except (AttributeError, ValueError, KeyError):
+        return None
+
+
+def parse_size(size):
+    """Return the (approximate) byte count of a file server size, or None if unknown."""
+    if isinstance(size, (int, float)):
+        return int(size)
+    parts = _split_size(size)
+    return int(parts[0] * parts[1]) if parts else None
+
+
+def size_matches(actual_bytes, reported_size):
+    """
+    Compare a byte count with the size reported by the file server. Sizes sent
+    as text ("12.30 KB") are rounded to two decimals, so they match within that rounding.
+    """
+    if isinstance(reported_size, (int, float)):
+        return actual_bytes == int(reported_size)
+    parts = _split_size(reported_size)
+    if parts is None:
+        return True
+    value, unit = parts
+    return abs(actual_bytes / unit - value) <= 0.005 + 1e-9
+
+
+def _expected_checksum(response):
+    # The Node server sends none today; verify when a proxy or a newer server does
+    checksum = response.headers.get("x-checksum-sha256")
+    if checksum:
+        return checksum.lower()
+    digest = response.headers.get("digest", "")
+    for part in digest.split(","):
+        algorithm, _, value = part.strip().partition("=")
+        if algorithm.lower() == "sha-256" and value:
+            return base64.b64decode(value).hex()
+    return None
+
+
+def _stream_to_file(download_url, payload, headers, part_path, budget, target=None):
+    """
+    Stream a download into part_path in DOWNLOAD_CHUNK_SIZE blocks, resuming
+    with a Range request after an interruption. With a target (e.g. a
+    SpillBuffer), the blocks are written to it instead of part_path.
+
+    Returns:
+        tuple: (bytes written, sha256 hex digest, checksum announced by the server or None)
+    """
+    written = 0
+    digest = hashlib.sha256()
+    expected_checksum = None
+    attempt = 0
+    with open(part_path, "wb") if target is None else nullcontext(target) as f:
+        while True:
+            request_headers = dict(headers)
+            if written:
+                request_headers["Range"] = f"bytes={written}-"
+            try:
+                with http_pool.stream("POST", download_url, data=payload, headers=request_headers) as response:
+                    content_range = response.headers.get("content-range", "")
+                    if response.status_code == 206 and written and content_range.startswith(f"bytes {written}-"):
+                        total = int(content_range.rsplit("/", 1)[-1] or 0)
+                    elif response.status_code in (200, 206):
+                        if written:
+                            # The server ignored the Range header (or answered another range): start over
+                            print(f"Server does not support resume, restarting download of {part_path}")
+                            f.seek(0)
+                            f.truncate()
+                            written = 0
+                            digest = hashlib.sha256()
+                        total = int(response.headers.get("content-length") or 0)
+                        if response.status_code == 206:
+                            raise DownloadVerificationError(f"Unexpected range {content_range}")
+                    else:
+                        raise DownloadVerificationError(f"Unexpected status {response.status_code}")
+                    if response.headers.get("content-encoding", "identity") != "identity":
+                        # Lengths refer to the encoded body, the blocks below are decoded
+                        total = 0
+                    expected_checksum = _expected_checksum(response) or expected_checksum
+                    for block in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        if budget is not None:
+                            budget.consume(len(block))
+                        f.write(block)
+                        digest.update(block)
+                        written += len(block)
+                if total and written < total:
+                    raise httpx.ReadError(f"Connection closed after {written} of {total} bytes")
+                return written, digest.hexdigest(), expected_checksum
+            except httpx.TransportError as e:
+                attempt += 1
+                if attempt > DOWNLOAD_RESUME_ATTEMPTS:
+                    raise
+                f.flush()
+                print(f"Download of {part_path} interrupted at {written} bytes, resuming: {str(e)}")
+                emit("download_resumed", counters={"downloads_resumed": 1}, path=part_path, offset=written)
+                time.sleep(DOWNLOAD_RESUME_BACKOFF_SECONDS * attempt)
+
+
+def download_single_file(rel_path, metadata, base_folder, in_memory=False):
     """
     Download a single file specified by rel_path and metadata
     and save it to the appropriate location under base_folder.
-    Returns the path of the downloaded file or None if download failed.
+    
+    The response is streamed to disk in chunks (memory use does not depend on
+    the file size) and resumed with HTTP Range requests when the connection
+    drops. The bytes count against the job's download budget, and the file is
+    checked against the size reported by the file server (and a checksum
+    header when the server sends one) before it is kept.
+    
+    With in_memory, the file is kept in memory and returned as an
+    InMemoryFile; it is only written to disk once it grows beyond
+    IN_MEMORY_MAX_BYTES.
+    
+    Returns the path of the downloaded file (or its InMemoryFile) or None if download failed.
     """
     # Split into directory and filename.
     directory, filename = os.path.split(rel_path)
@@ -120,7 +382,8 @@ def download_single_file(rel_path, metadata, base_folder):
     # Remove any leading slash from the directory and join with base_folder.
     relative_dir = directory.lstrip('/')
     dest_dir = os.path.join(base_folder, relative_dir)
-    os.makedirs(dest_dir, exist_ok=True)
+    if not in_memory:
+        os.makedirs(dest_dir, exist_ok=True)
     
     # Build payload
     payload_dict = {
@@ -140,21 +403,259 @@ def download_single_file(rel_path, metadata, base_folder):
     download_url = fileServer + "/Download"
     print(f"Downloading from: {download_url} - File: {filename}")
     
+    file_path = os.path.join(dest_dir, filename)
+    part_path = file_path + ".part"
+    budget = _download_budget.get()
+    buffer = None
     try:
-        response = requests.post(download_url, data=payload, headers=headers)
-        if response.status_code == 200:
-            # Save the downloaded file in the proper subdirectory.
-            file_path = os.path.join(dest_dir, filename)
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            print(f"Downloaded: {file_path}")
-            return file_path
-        else:
-            print(f"Failed to download {filename} from {download_url}: {response.status_code}")
-            return None
+        expected_bytes = parse_size(metadata.get("size"))
+        if budget is not None and expected_bytes:
+            budget.check(expected_bytes)
+        budget_error = None
+        if in_memory:
+            buffer = SpillBuffer(part_path, IN_MEMORY_MAX_BYTES)
+        with _download_slot() as outcome:
+            try:
+                with _download_slots:
+                    # Waiting for the downloads of other jobs is not latency of the file server
+                    started = time.time()
+                    try:
+                        size, sha256, expected_checksum = _stream_to_file(
+                            download_url, payload, headers, part_path, budget, target=buffer
+                        )
+                    finally:
+                        outcome["seconds"] = time.time() - started
+                outcome["bytes"] = size
+            except DownloadBudgetExceeded as e:
+                # Not a sign of an overloaded server, so raised outside the slot
+                budget_error = e
+        if budget_error is not None:
+            raise budget_error
+        if not size_matches(size, metadata.get("size")):
+            raise DownloadVerificationError(f"Size {format_size(size)} does not match {metadata.get('size')}")
+        if expected_checksum is not None and expected_checksum != sha256:
+            raise DownloadVerificationError(f"SHA-256 {sha256} does not match {expected_checksum}")
+        if buffer is not None and not buffer.spilled:
+            print(f"Downloaded to memory: {file_path}")
+            emit("file_downloaded", counters={"files_downloaded": 1, "bytes_downloaded": size, "files_in_memory": 1},
+                 path=rel_path, bytes=size, sha256=sha256, in_memory=True)
+            return InMemoryFile(file_path, buffer.getvalue(), sha256)
+        if buffer is not None:
+            buffer.close()
+        os.replace(part_path, file_path)
+        stats = os.stat(file_path)
+        downloaded_checksums[file_path] = (stats.st_size, stats.st_mtime_ns, sha256)
+        print(f"Downloaded: {file_path}")
+        emit("file_downloaded", counters={"files_downloaded": 1, "bytes_downloaded": size},
+             path=rel_path, bytes=size, sha256=sha256)
+        return file_path
     except Exception as e:
         print(f"Error downloading {filename}: {str(e)}")
+        if buffer is not None:
+            buffer.close()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if isinstance(e, DownloadBudgetExceeded):
+            emit("download_budget_exceeded", counters={"downloads_failed": 1}, path=rel_path, error=str(e))
+        else:
+            emit("download_failed", counters={"downloads_failed": 1}, path=rel_path, error=str(e))
+        return None
+
+
+def plan_archive_batches(file_tuples):
+    """
+    Group files by directory into batches for archive downloads.
+    
+    The file server flattens the files of a multi-file download to their
+    names, so a batch only holds files of one directory. Batches are capped by
+    ARCHIVE_BATCH_MAX_FILES and ARCHIVE_BATCH_MAX_BYTES; a file left alone in
+    its batch is downloaded on its own.
+    
+    Returns:
+        tuple: (list of batches of (relative_path, metadata), list of single (relative_path, metadata))
+    """
+    by_directory = {}
+    for rel_path, metadata in file_tuples:
+        by_directory.setdefault(os.path.dirname(rel_path), []).append((rel_path, metadata))
+    
+    batches = []
+    singles = []
+    
+    def close(batch):
+        if len(batch) > 1:
+            batches.append(batch)
+        else:
+            singles.extend(batch)
+    
+    for directory_files in by_directory.values():
+        batch = []
+        batch_bytes = 0
+        for rel_path, metadata in directory_files:
+            size = parse_size(metadata.get("size")) or 0
+            if batch and (len(batch) >= ARCHIVE_BATCH_MAX_FILES or batch_bytes + size > ARCHIVE_BATCH_MAX_BYTES):
+                close(batch)
+                batch = []
+                batch_bytes = 0
+            batch.append((rel_path, metadata))
+            batch_bytes += size
+        close(batch)
+    return batches, singles
+
+
+def download_archive(file_tuples, base_folder, on_file, in_memory=False):
+    """
+    Download files of one directory as a single zip archive and extract them
+    under base_folder, replicating the source hierarchy.
+    
+    The archive is streamed to a temporary file (so memory use does not
+    depend on its size) and its members are then extracted one by one;
+    on_file(relative_path, file_path) is called as soon as each file is on
+    disk, so extraction can start before the whole archive is unpacked.
+    
+    With in_memory, the archive and its members stay in memory up to
+    IN_MEMORY_MAX_BYTES each and members are passed to on_file as InMemoryFile.
+    
+    Args:
+        file_tuples: (relative_path, metadata) tuples of files in the same directory
+        base_folder: Job workspace the files are written to
+        on_file: Callback receiving (relative_path, file_path) of every extracted file
+        in_memory: Keep the archive and its files in memory when they are small enough
+        
+    Returns:
+        list: (relative_path, metadata) of the files that could not be obtained
+              from the archive and have to be downloaded one by one
+    """
+    directory = os.path.dirname(file_tuples[0][0]).rstrip('/') + '/'
+    dest_dir = os.path.join(base_folder, directory.lstrip('/'))
+    if not in_memory:
+        os.makedirs(dest_dir, exist_ok=True)
+    
+    payload_dict = {
+        "action": "download",
+        "path": directory,
+        "names": [os.path.basename(rel_path) for rel_path, _ in file_tuples],
+        "data": [metadata for _, metadata in file_tuples]
+    }
+    payload = {
+        "downloadInput": json.dumps(payload_dict)
+    }
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Origin": "http://localhost:3000",
+        "User-Agent": "Mozilla/5.0"
+    }
+    download_url = fileServer + "/Download"
+    print(f"Downloading archive of {len(file_tuples)} files from {directory}")
+    
+    buffer = None
+    if in_memory:
+        archive_path = os.path.join(base_folder, f"archive-{next(_archive_ids)}.zip")
+        buffer = SpillBuffer(archive_path, IN_MEMORY_MAX_BYTES)
+    else:
+        fd, archive_path = tempfile.mkstemp(dir=base_folder, suffix=".zip")
+        os.close(fd)
+    
+    def remove_archive():
+        if buffer is not None:
+            buffer.close()
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+    
+    budget = _download_budget.get()
+    try:
+        with _archive_lock, _download_slots:
+            archive_bytes, _, _ = _stream_to_file(download_url, payload, headers, archive_path, budget, target=buffer)
+        emit("archive_downloaded", counters={"archives_downloaded": 1, "bytes_downloaded": archive_bytes},
+             path=directory, files=len(file_tuples), bytes=archive_bytes)
+    except Exception as e:
+        print(f"Archive download of {directory} failed, falling back to single downloads: {str(e)}")
+        emit("archive_failed", counters={"archives_failed": 1}, path=directory, error=str(e))
+        remove_archive()
+        return list(file_tuples)
+    
+    extracted = set()
+    try:
+        with zipfile.ZipFile(archive_path if buffer is None else buffer.fileobj()) as archive:
+            members = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+            for rel_path, metadata in file_tuples:
+                filename = os.path.basename(rel_path)
+                info = members.get(filename)
+                if info is None:
+                    print(f"{filename} is missing from the archive of {directory}")
+                    continue
+                if not size_matches(info.file_size, metadata.get("size")):
+                    print(f"{filename} in the archive does not match its size {metadata.get('size')}")
+                    continue
+                file_path = os.path.join(dest_dir, filename)
+                if in_memory and info.file_size <= IN_MEMORY_MAX_BYTES:
+                    data = archive.read(info)
+                    sha256 = hashlib.sha256(data).hexdigest()
+                    extracted.add(rel_path)
+                    emit("file_downloaded", counters={"files_downloaded": 1, "files_in_memory": 1}, path=rel_path,
+                         bytes=info.file_size, sha256=sha256, archive=True, in_memory=True)
+                    on_file(rel_path, InMemoryFile(file_path, data, sha256))
+                    continue
+                os.makedirs(dest_dir, exist_ok=True)
+                digest = hashlib.sha256()
+                with archive.open(info) as source, open(file_path + ".part", "wb") as target:
+                    for block in iter(lambda: source.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        target.write(block)
+                        digest.update(block)
+                os.replace(file_path + ".part", file_path)
+                stats = os.stat(file_path)
+                downloaded_checksums[file_path] = (stats.st_size, stats.st_mtime_ns, digest.hexdigest())
+                extracted.add(rel_path)
+                emit("file_downloaded", counters={"files_downloaded": 1}, path=rel_path,
+                     bytes=info.file_size, sha256=digest.hexdigest(), archive=True)
+                on_file(rel_path, file_path)
+    except Exception as e:
+        # e.g. an error answer instead of a zip, or a truncated archive
+        print(f"Could not extract the archive of {directory}: {str(e)}")
+        emit("archive_failed", counters={"archives_failed": 1}, path=directory, error=str(e))
+    finally:
+        remove_archive()
+    
+    return [(rel_path, metadata) for rel_path, metadata in file_tuples if rel_path not in extracted]
+
+
+def forget_downloads(base_folder):
+    """Drop the recorded checksums of the files under base_folder (called when it is removed)."""
+    prefix = os.path.join(base_folder, "")
+    for file_path in [path for path in downloaded_checksums if path.startswith(prefix)]:
+        downloaded_checksums.pop(file_path, None)
+
+
+def checksum_of(file_path):
+    """Return the SHA-256 computed while downloading file_path, if the file is unchanged since."""
+    if isinstance(file_path, InMemoryFile):
+        return file_path.sha256
+    entry = downloaded_checksums.get(file_path)
+    if entry is None:
         return None
+    try:
+        stats = os.stat(file_path)
+    except OSError:
+        return None
+    size, mtime_ns, sha256 = entry
+    return sha256 if (stats.st_size, stats.st_mtime_ns) == (size, mtime_ns) else None
+
+def filter_skipped_files(file_tuples):
+    """
+    Split file tuples into the ones to download and the skipped audio/video files.
+    
+    Returns:
+        tuple: (list of (relative_path, metadata) to download, list of skipped relative paths)
+    """
+    filtered_file_tuples = []
+    skipped_files = []
+    for rel_path, metadata in file_tuples:
+        file_ext = os.path.splitext(rel_path)[1].lower()
+        if file_ext in SKIP_EXTENSIONS:
+            print(f"Skipping audio/video file: {rel_path}")
+            skipped_files.append(rel_path)
+        else:
+            filtered_file_tuples.append((rel_path, metadata))
+    return filtered_file_tuples, skipped_files
 
 def download_files(file_tuples, folder_name):
     """
@@ -164,12 +665,15 @@ def download_files(file_tuples, folder_name):
     Creates a folder named after the provided folder_name (converted to a string)
     under UPLOAD_DIR and replicates the source folder hierarchy when saving the files.
     
-    Uses MAX_CONCURRENT_DOWNLOADS to limit the number of concurrent downloads.
+    Uses MAX_CONCURRENT_DOWNLOADS threads; the number of downloads actually
+    in flight is tuned by download_concurrency().
     Skips audio and video files based on their extensions.
+    Copies of a file (same name, exact size and modification date) are
+    downloaded once and copied locally.
     """
     downloaded_files = []
+    downloaded_paths = {}  # relative path -> local path
     failed_downloads = []
-    skipped_files = []
     
     # Convert folder_name (UUID) to string and create the base folder.
     folder_name_str = str(folder_name)
@@ -177,14 +681,7 @@ def download_files(file_tuples, folder_name):
     os.makedirs(base_folder, exist_ok=True)
     
     # Filter out audio and video files
-    filtered_file_tuples = []
-    for rel_path, metadata in file_tuples:
-        file_ext = os.path.splitext(rel_path)[1].lower()
-        if file_ext in SKIP_EXTENSIONS:
-            print(f"Skipping audio/video file: {rel_path}")
-            skipped_files.append(rel_path)
-        else:
-            filtered_file_tuples.append((rel_path, metadata))
+    filtered_file_tuples, skipped_files = filter_skipped_files(file_tuples)
     
     print(f"Starting download of {len(filtered_file_tuples)} files (skipped {len(skipped_files)} audio/video files) with max {MAX_CONCURRENT_DOWNLOADS} concurrent downloads")
     
@@ -193,12 +690,27 @@ def download_files(file_tuples, folder_name):
         print("No files to download after filtering out audio/video files.")
         return []
     
+    copies = {}
+    if DEDUPLICATE_FILES:
+        filtered_file_tuples, copies = group_by_metadata(filtered_file_tuples)
+    
+    def on_file(rel_path, file_path):
+        downloaded_files.append(file_path)
+        downloaded_paths[rel_path] = file_path
+    
+    # Files sharing a directory come as archives; what is left (or fails) is downloaded one by one
+    single_file_tuples = filtered_file_tuples
+    if BULK_DOWNLOADS:
+        batches, single_file_tuples = plan_archive_batches(filtered_file_tuples)
+        for batch in batches:
+            single_file_tuples.extend(download_archive(batch, base_folder, on_file))
+    
     # Use ThreadPoolExecutor to handle concurrent downloads
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+    with download_concurrency(), concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
         # Submit all download tasks
         future_to_file = {
-            executor.submit(download_single_file, rel_path, metadata, base_folder): (rel_path, metadata)
-            for rel_path, metadata in filtered_file_tuples
+            executor.submit(propagate_context(download_single_file), rel_path, metadata, base_folder): (rel_path, metadata)
+            for rel_path, metadata in single_file_tuples
         }
         
         # Process completed downloads
@@ -207,13 +719,36 @@ def download_files(file_tuples, folder_name):
             try:
                 file_path = future.result()
                 if file_path:
-                    downloaded_files.append(file_path)
+                    on_file(rel_path, file_path)
                 else:
                     failed_downloads.append((rel_path, metadata))
             except Exception as e:
                 print(f"Exception occurred while downloading {os.path.basename(rel_path)}: {str(e)}")
                 failed_downloads.append((rel_path, metadata))
     
+    for rel_path, copy_tuples in copies.items():
+        if rel_path not in downloaded_paths:
+            # The kept file failed, so its copies are tried in turn; the first one that
+            # downloads is kept instead, and every other path becomes a copy of it
+            candidates = [item for item in failed_downloads if item[0] == rel_path] + copy_tuples
+            for index, (copy_path, copy_metadata) in enumerate(candidates[1:], start=1):
+                file_path = download_single_file(copy_path, copy_metadata, base_folder)
+                if file_path:
+                    on_file(copy_path, file_path)
+                    failed_downloads.remove(candidates[0])
+                    rel_path, copy_tuples = copy_path, candidates[:index] + candidates[index + 1:]
+                    break
+            else:
+                failed_downloads.extend(copy_tuples)
+                continue
+        source = downloaded_paths[rel_path]
+        for copy_path, copy_metadata in copy_tuples:
+            file_path = os.path.join(base_folder, copy_path.lstrip('/'))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            shutil.copyfile(source, file_path)
+            downloaded_files.append(file_path)
+            emit("duplicate_copied", counters={"duplicate_downloads_skipped": 1}, path=copy_path, duplicate_of=rel_path)
+    
     print(f"Download complete. Successfully downloaded {len(downloaded_files)} files.")
     if failed_downloads:
         print(f"Failed to download {len(failed_downloads)} files.")
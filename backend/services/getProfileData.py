@@ -1,6 +1,6 @@
 import os
 import json
-import requests
+from services.httpClient import http_pool
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -42,7 +42,7 @@ def search_contactout(name, companies):
     }
     
     # Make the API request
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = http_pool.post(url, headers=headers, content=json.dumps(payload))
     
     # Check if the request was successful
     response.raise_for_status()
@@ -0,0 +1,224 @@
+import importlib.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from services.progress import emit
+
+HTTP_CONNECT_TIMEOUT = 10  # Seconds to open a connection
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))  # Seconds between received bytes
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_KEEPALIVE_SECONDS = 30  # Idle connections are closed after this long
+HTTP_RETRIES = 3  # Retries after a connection error or a retryable status
+HTTP_BACKOFF_SECONDS = 0.5  # First retry delay, doubled on every attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# HTTP/2 needs the optional h2 package; without it connections stay on HTTP/1.1 keep-alive
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+
+def origin_of(url: str) -> str:
+    """Return the scheme://host[:port] part of a URL, which identifies its connection pool."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def client_options(max_connections: int = HTTP_MAX_CONNECTIONS_PER_HOST) -> Dict[str, Any]:
+    """Settings shared by every client, sync or async."""
+    return {
+        "timeout": httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+        ),
+        "http2": HTTP2_ENABLED,
+    }
+
+
+class HostMetrics:
+    """Request, connection and retry counters of one host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.retries = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        reused = max(0, self.requests - self.connections_opened)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connection_reuse_rate": round(reused / self.requests, 3) if self.requests else None,
+            "retries": self.retries,
+            "failures": self.failures,
+            "average_seconds": round(self.seconds / self.requests, 3) if self.requests else None,
+        }
+
+
+class HttpClientPool:
+    """
+    Process-wide keep-alive HTTP clients, one connection pool per host.
+
+    Every outbound call in services/ goes through request(), which adds
+    timeouts, retries with exponential backoff on connection errors and
+    retryable status codes, and per-host metrics. New connections are counted
+    through httpx's trace extension, so the stats show how often connections
+    are reused.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.Client] = {}
+        self._metrics: Dict[str, HostMetrics] = {}
+        self._lock = threading.Lock()
+
+    def metrics_for(self, origin: str) -> HostMetrics:
+        with self._lock:
+            return self._metrics.setdefault(origin, HostMetrics())
+
+    def client_for(self, url: str) -> httpx.Client:
+        origin = origin_of(url)
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is None:
+                client = httpx.Client(**client_options())
+                self._clients[origin] = client
+            return client
+
+    def record_request(self, origin: str, seconds: float = 0.0, failed: bool = False) -> None:
+        metrics = self.metrics_for(origin)
+        with self._lock:
+            metrics.requests += 1
+            metrics.seconds += seconds
+            if failed:
+                metrics.failures += 1
+
+    def trace(self, origin: str):
+        """Return an httpx trace callback counting the connections opened for origin."""
+        metrics = self.metrics_for(origin)
+
+        def on_event(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    metrics.connections_opened += 1
+
+        return on_event
+
+    def request(self, method: str, url: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+        """
+        Send a request on the pooled client of the URL's host.
+
+        Args:
+            method: HTTP method
+            url: Absolute URL
+            retries: Retries after a connection error or a retryable status;
+                     pass 0 for requests that must not be repeated
+            **kwargs: Passed to httpx.Client.request (json, data, files, content, headers, ...)
+
+        Returns:
+            The last response (a retryable status is returned once retries are exhausted)
+
+        Raises:
+            httpx.TransportError: If the last attempt failed to connect or read
+        """
+        origin = origin_of(url)
+        client = self.client_for(url)
+        metrics = self.metrics_for(origin)
+        extensions = {**kwargs.pop("extensions", {}), "trace": self.trace(origin)}
+        delay = HTTP_BACKOFF_SECONDS
+        for attempt in range(retries + 1):
+            start = time.time()
+            try:
+                response = client.request(method, url, extensions=extensions, **kwargs)
+            except httpx.TransportError as e:
+                self.record_request(origin, time.time() - start, failed=True)
+                if attempt == retries:
+                    raise
+                error = str(e) or type(e).__name__
+            else:
+                self.record_request(origin, time.time() - start)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                    return response
+                error = f"status {response.status_code}"
+                retry_after = response.headers.get("retry-after", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            with self._lock:
+                metrics.retries += 1
+            print(f"Retrying {method} {url} in {delay}s ({error})")
+            emit("http_retry", counters={"http_retries": 1}, host=origin, error=error)
+            time.sleep(delay)
+            delay *= 2
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs):
+        """
+        Send a request and yield the response before its body is read.
+
+        Streams are not retried here: a caller reading a large body resumes
+        it itself (e.g. with a Range request) rather than starting over.
+        """
+        origin = origin_of(url)
+        client = self.client_for(url)
+        extensions = {**kwargs.pop("extensions", {}), "trace": self.trace(origin)}
+        start = time.time()
+        try:
+            with client.stream(method, url, extensions=extensions, **kwargs) as response:
+                yield response
+        except httpx.TransportError:
+            self.record_request(origin, time.time() - start, failed=True)
+            raise
+        self.record_request(origin, time.time() - start)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "http2": HTTP2_ENABLED,
+                "max_connections_per_host": HTTP_MAX_CONNECTIONS_PER_HOST,
+                "hosts": {origin: metrics.to_dict() for origin, metrics in self._metrics.items()},
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+http_pool = HttpClientPool()
+
+
+def new_async_client(max_connections: int = HTTP_MAX_CONNECTIONS_PER_HOST, origin: Optional[str] = None) -> httpx.AsyncClient:
+    """
+    Create an async client with the shared settings.
+
+    Async clients are bound to the event loop they are used on, so callers
+    running their own loop (e.g. the tree crawler) create one per loop. With
+    an origin, its new connections are counted in the shared metrics.
+    """
+    client = httpx.AsyncClient(**client_options(max_connections))
+    if origin is not None:
+        trace = http_pool.trace(origin)
+
+        async def on_event(event_name: str, info: Dict[str, Any]) -> None:
+            trace(event_name, info)
+
+        async def count_request(request: httpx.Request) -> None:
+            request.extensions["trace"] = on_event
+            http_pool.record_request(origin)
+
+        client.event_hooks["request"] = [count_request]
+    return client
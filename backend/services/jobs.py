@@ -0,0 +1,121 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from services.progress import ProgressTracker, tracking
+
+MAX_CONCURRENT_JOBS = 3  # Number of analyses allowed to run at the same time
+JOB_RETENTION_SECONDS = 60 * 60  # How long finished jobs are kept for polling
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class Job:
+    """
+    A unit of background work submitted to the job pool.
+
+    The job keeps its own status, timestamps, result, error and progress tracker
+    so that it can be polled or streamed from the API while the work runs on a
+    worker thread.
+    """
+
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.params = params
+        self.status = JOB_QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        self.progress = ProgressTracker()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the public status of the job (without the result payload)."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.snapshot(),
+        }
+
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="analysis-job")
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+
+
+def _run_job(job: Job, fn: Callable, args: tuple) -> Any:
+    job.status = JOB_RUNNING
+    job.started_at = time.time()
+    print(f"Job {job.id} ({job.kind}) started")
+    job.progress.emit("job_started", job_id=job.id, kind=job.kind, params=job.params)
+    try:
+        with tracking(job.progress):
+            job.result = fn(*args)
+        job.status = JOB_COMPLETED
+        return job.result
+    except Exception as e:
+        job.error = str(e)
+        job.status = JOB_FAILED
+        print(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+        raise
+    finally:
+        job.finished_at = time.time()
+        job.progress.close(job.status)
+        print(f"Job {job.id} ({job.kind}) finished with status {job.status}")
+
+
+def submit_job(kind: str, fn: Callable, *args, **params) -> Job:
+    """
+    Submit a blocking function to the bounded job pool.
+
+    Args:
+        kind: Short name of the job type (e.g. "analyze")
+        fn: Blocking function to run on a worker thread
+        *args: Positional arguments passed to fn
+        **params: Parameters recorded on the job for status reporting
+
+    Returns:
+        Job: The queued job; job.future resolves to the return value of fn
+    """
+    prune_jobs()
+    job = Job(kind, params)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.future = _executor.submit(_run_job, job, fn, args)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Return the job with the given id or None if it is unknown or expired."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def prune_jobs(max_age: float = JOB_RETENTION_SECONDS) -> None:
+    """Forget finished jobs older than max_age seconds."""
+    now = time.time()
+    with _jobs_lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job.done and job.finished_at is not None and now - job.finished_at > max_age
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
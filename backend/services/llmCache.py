@@ -0,0 +1,185 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from services.diskCache import DiskCache
+
+LLM_CACHE_ENABLED = True
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # Cached responses expire after a week
+LLM_CACHE_MEMORY_ENTRIES = 256  # Responses kept in the in-memory tier
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_responses.sqlite")
+LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB of responses in the disk tier
+
+_bypass: contextvars.ContextVar = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+class MemoryLRUCache:
+    """
+    Thread-safe in-memory LRU cache with a maximum number of entries and a TTL.
+
+    Args:
+        max_entries: Maximum number of entries kept
+        ttl: Time-to-live of each entry in seconds (None for no expiry)
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": "llm_responses_memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of chat completion responses: in-memory LRU in front of a
+    persistent DiskCache. Disk hits are promoted into memory.
+
+    Any object with the same get/set/clear/stats methods can be installed
+    instead with set_llm_cache().
+    """
+
+    def __init__(self, memory: MemoryLRUCache, disk: Optional[DiskCache], ttl: Optional[float]):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl=self.ttl)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        stats = [self.memory.stats()]
+        if self.disk is not None:
+            stats.append(self.disk.stats())
+        return stats
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def response_cache_key(model: str, messages: List[Dict], response_format: Optional[Dict]) -> str:
+    """
+    Build the cache key of a chat completion request.
+
+    The key covers the model, a hash of the system prompt(s), a hash of the
+    remaining messages and the response format.
+    """
+    system_content = "\n".join(m["content"] for m in messages if m.get("role") == "system")
+    user_content = json.dumps([
+        {"role": m.get("role"), "content": m.get("content")}
+        for m in messages if m.get("role") != "system"
+    ])
+    return _sha256(json.dumps({
+        "model": model,
+        "system": _sha256(system_content),
+        "user": _sha256(user_content),
+        "response_format": response_format,
+    }, sort_keys=True))
+
+
+def cache_bypassed() -> bool:
+    """Whether the current run asked to skip cached responses."""
+    return not LLM_CACHE_ENABLED or _bypass.get()
+
+
+@contextmanager
+def bypass_llm_cache(bypass: bool = True):
+    """
+    Skip cached responses for the OpenAI calls made inside the block.
+
+    Fresh responses are still written to the cache (unless LLM_CACHE_ENABLED
+    is off), so a forced re-run refreshes the cached analysis.
+    """
+    token = _bypass.set(bypass)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _build_default_cache() -> LLMResponseCache:
+    try:
+        disk = DiskCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, name="llm_responses_disk")
+    except Exception as e:
+        print(f"LLM disk cache unavailable, using memory only: {str(e)}")
+        disk = None
+    return LLMResponseCache(MemoryLRUCache(LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL_SECONDS), disk, LLM_CACHE_TTL_SECONDS)
+
+
+llm_cache = _build_default_cache()
+
+
+def get_llm_cache():
+    return llm_cache
+
+
+def set_llm_cache(cache) -> None:
+    """Install a different cache implementation (e.g. a shared Redis-backed one)."""
+    global llm_cache
+    llm_cache = cache
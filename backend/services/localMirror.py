@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from services.analysisState import file_signature
+from services.files import checksum_of, download_archive, download_single_file, downloaded_checksums
+from services.progress import emit
+
+LOCAL_MIRROR_DIR = os.getenv("LOCAL_MIRROR_DIR")  # Keep a synced copy of the analyzed files here (off when unset)
+MIRROR_MANIFEST = ".mirror.sqlite"  # Manifest file inside the mirror directory
+
+
+class LocalMirror:
+    """
+    Local copy of the file server, kept in sync file by file.
+
+    Files are stored under root with the same relative paths as on the file
+    server. A SQLite manifest records the size and modification date the file
+    server reported for every mirrored file, plus its local size, mtime and
+    SHA-256. A file is transferred again only when the reported size or date
+    changed (or the local copy was altered); files that disappeared from a
+    synced directory are removed.
+
+    Downloads of the same file by concurrent jobs are serialized, so a file is
+    never written twice at the same time.
+
+    Args:
+        root: Directory of the mirror
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.hits = 0
+        self.transfers = 0
+        self.removed = 0
+        self._lock = threading.Lock()
+        self._file_locks: Dict[str, threading.Lock] = {}
+
+        os.makedirs(self.root, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.root, MIRROR_MANIFEST), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size TEXT NOT NULL,"
+            " modified TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT,"
+            " synced_at REAL NOT NULL)"
+        )
+
+    def local_path(self, rel_path: str) -> str:
+        return os.path.join(self.root, rel_path.lstrip("/"))
+
+    def _file_lock(self, rel_path: str) -> threading.Lock:
+        with self._lock:
+            return self._file_locks.setdefault(rel_path, threading.Lock())
+
+    def fresh_path(self, rel_path: str, metadata: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the local copy of a file if it matches the file server metadata,
+        or None if it has to be transferred.
+        """
+        signature = file_signature(metadata)
+        if signature is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, modified, bytes, mtime_ns, sha256 FROM files WHERE path = ?", (rel_path,)
+            ).fetchone()
+        if row is None or [row[0], row[1]] != [str(value) for value in signature]:
+            return None
+        file_path = self.local_path(rel_path)
+        try:
+            stats = os.stat(file_path)
+        except OSError:
+            return None
+        if (stats.st_size, stats.st_mtime_ns) != (row[2], row[3]):
+            return None
+        if row[4]:
+            # Lets the extraction cache key the file without hashing it again
+            downloaded_checksums[file_path] = (row[2], row[3], row[4])
+        return file_path
+
+    def split(self, file_tuples: Iterable[Tuple[str, Dict]]) -> Tuple[List[Tuple[str, Dict]], List[Tuple[str, Dict]]]:
+        """
+        Returns:
+            tuple: (files whose local copy is current, files to transfer)
+        """
+        fresh, stale = [], []
+        for rel_path, metadata in file_tuples:
+            (fresh if self.fresh_path(rel_path, metadata) is not None else stale).append((rel_path, metadata))
+        return fresh, stale
+
+    def record(self, rel_path: str, metadata: Dict[str, Any], file_path: str) -> None:
+        """Remember the file server metadata of a file just written to the mirror."""
+        signature = file_signature(metadata)
+        if signature is None:
+            return
+        stats = os.stat(file_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, modified, bytes, mtime_ns, sha256, synced_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rel_path, str(signature[0]), str(signature[1]), stats.st_size, stats.st_mtime_ns,
+                 checksum_of(file_path), time.time())
+            )
+            self.transfers += 1
+
+    def download_file(self, rel_path: str, metadata: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the local copy of a file, transferring it first when it changed.
+
+        Returns:
+            The path of the file in the mirror, or None if the transfer failed
+        """
+        with self._file_lock(rel_path):
+            file_path = self.fresh_path(rel_path, metadata)
+            if file_path is not None:
+                with self._lock:
+                    self.hits += 1
+                emit("mirror_hit", counters={"mirror_hits": 1}, path=rel_path)
+                return file_path
+            file_path = download_single_file(rel_path, metadata, self.root)
+            if file_path is not None:
+                self.record(rel_path, metadata, file_path)
+            return file_path
+
+    def download_archive(self, file_tuples: List[Tuple[str, Dict]],
+                         on_file: Callable[[str, str], None]) -> List[Tuple[str, Dict]]:
+        """
+        Transfer files of one directory as an archive into the mirror (see
+        files.download_archive).
+
+        Returns:
+            list: (relative_path, metadata) of the files that still have to be transferred one by one
+        """
+        metadata_by_path = dict(file_tuples)
+
+        def on_mirrored(rel_path: str, file_path: str) -> None:
+            self.record(rel_path, metadata_by_path[rel_path], file_path)
+            on_file(rel_path, file_path)
+
+        with ExitStack() as stack:
+            # Sorted, so that two jobs locking overlapping batches cannot deadlock
+            for rel_path in sorted(metadata_by_path):
+                stack.enter_context(self._file_lock(rel_path))
+            return download_archive(file_tuples, self.root, on_mirrored)
+
+    def prune(self, top_directories: Iterable[str], present_paths: Iterable[str]) -> int:
+        """
+        Remove mirrored files below the given top-level directories that are
+        no longer on the file server.
+
+        Args:
+            top_directories: Names of the synced top-level directories (e.g. "Alpine VC")
+            present_paths: Relative paths of every file currently below them
+
+        Returns:
+            int: Number of files removed
+        """
+        present = set(present_paths)
+        stale = []
+        with self._lock:
+            for top in set(top_directories):
+                prefix = f"/{top}/"
+                rows = self._conn.execute(
+                    "SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+                stale.extend(path for (path,) in rows if path not in present)
+        for rel_path in stale:
+            with self._file_lock(rel_path):
+                file_path = self.local_path(rel_path)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                downloaded_checksums.pop(file_path, None)
+                with self._lock:
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+                    self.removed += 1
+        if stale:
+            print(f"Removed {len(stale)} files from the local mirror that are no longer on the file server")
+            emit("mirror_pruned", counters={"mirror_files_removed": len(stale)}, files=len(stale))
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            files, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM files").fetchone()
+            return {
+                "name": "local_mirror",
+                "root": self.root,
+                "files": files,
+                "bytes": total_bytes,
+                "hits": self.hits,
+                "transfers": self.transfers,
+                "removed": self.removed,
+            }
+
+
+local_mirror = LocalMirror(LOCAL_MIRROR_DIR) if LOCAL_MIRROR_DIR else None
@@ -0,0 +1,96 @@
+import io
+import os
+from typing import Optional
+
+
+class InMemoryFile:
+    """
+    A downloaded file kept in memory instead of being written to the job workspace.
+
+    Extractors accept it in place of a file path. str() gives the path the file
+    would have had on disk, so logs, file types and events stay the same.
+
+    Args:
+        path: Path the file would have been saved to
+        data: Content of the file
+        sha256: SHA-256 hex digest of data, computed while downloading
+    """
+
+    def __init__(self, path: str, data: bytes, sha256: Optional[str] = None):
+        self.path = path
+        self.data = data
+        self.sha256 = sha256
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def open(self) -> io.BytesIO:
+        return io.BytesIO(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __str__(self) -> str:
+        return self.path
+
+
+class SpillBuffer:
+    """
+    Writable buffer that stays in memory up to max_bytes and moves its content
+    to spill_path once it grows beyond that.
+
+    Supports the file operations used while streaming a download (write, seek,
+    truncate, flush, tell), so it can stand in for a file opened with "wb".
+
+    Args:
+        spill_path: File the content is moved to when it gets too large
+        max_bytes: Largest content kept in memory
+    """
+
+    def __init__(self, spill_path: str, max_bytes: int):
+        self.spill_path = spill_path
+        self.max_bytes = max_bytes
+        self._file = io.BytesIO()
+        self.spilled = False
+
+    def write(self, data: bytes) -> int:
+        if not self.spilled and self._file.tell() + len(data) > self.max_bytes:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            spill_file = open(self.spill_path, "w+b")
+            spill_file.write(self._file.getbuffer())
+            self._file = spill_file
+            self.spilled = True
+        return self._file.write(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        return self._file.truncate(size)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def getvalue(self) -> bytes:
+        """Return the content of a buffer that has not spilled."""
+        if self.spilled:
+            raise ValueError(f"Content was spilled to {self.spill_path}")
+        return self._file.getvalue()
+
+    def fileobj(self):
+        """Return the underlying file object, positioned at the start (e.g. for zipfile)."""
+        self._file.seek(0)
+        return self._file
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,52 @@
+import hashlib
+import os
+from typing import Optional
+
+from PIL import Image
+
+from services.diskCache import DiskCache
+
+OCR_CACHE_ENABLED = True
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "cache/ocr_pages.sqlite")
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 256 MB of page text
+
+ocr_cache = DiskCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES, name="ocr_pages")
+
+
+def page_cache_key(image: Image.Image, settings: str) -> str:
+    """
+    Build the cache key of a page image: the OCR settings and the SHA-256 of
+    its pixels.
+
+    The hash is exact rather than perceptual: pages that only differ in a
+    figure or a date must not share their text. Recurring pages (signature
+    pages, covers, disclaimers) embedded as the same image still render to
+    the same pixels, in any PDF and on every run.
+
+    Args:
+        image: Page as it is passed to the OCR engine
+        settings: Everything else the text depends on (engine, language, resolution, version)
+    """
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode("utf-8"))
+    digest.update(image.tobytes())
+    return f"{settings}:{digest.hexdigest()}"
+
+
+def lookup_page_text(key: str) -> Optional[str]:
+    """Return the cached text of a page, or None when it was not OCR'd before."""
+    if not OCR_CACHE_ENABLED:
+        return None
+    try:
+        return ocr_cache.get(key)
+    except Exception as e:
+        print(f"OCR cache unavailable: {str(e)}")
+        return None
+
+
+def store_page_text(key: str, text: str) -> None:
+    if not OCR_CACHE_ENABLED:
+        return
+    try:
+        ocr_cache.set(key, text)
+    except Exception as e:
+        print(f"Could not store OCR text in cache: {str(e)}")
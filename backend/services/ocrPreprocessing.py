@@ -0,0 +1,131 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+OCR_PREPROCESS = True  # Clean up rendered pages with NumPy before they are OCR'd
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))  # Pages are rendered at no more than this for OCR (0: no cap)
+OCR_BINARIZE_WINDOW_INCHES = 1 / 6  # Side of the neighbourhood a pixel is compared with
+OCR_BINARIZE_THRESHOLD = 0.15  # A pixel is ink when this much darker than its neighbourhood
+OCR_BLANK_INK_RATIO = 0.0005  # Pages with less ink than this (a stray page number, scanner dust) are not OCR'd
+OCR_MAX_SKEW_DEGREES = 5.0  # Deskew range searched
+OCR_SKEW_STEP_DEGREES = 0.25
+OCR_MIN_DESKEW_DEGREES = 0.3  # Smaller skews are left alone; tesseract copes with them
+OCR_SKEW_SAMPLE_PIXELS = 100_000  # Ink pixels used to estimate the skew
+
+
+def to_grayscale(image: Image.Image) -> np.ndarray:
+    """Return the page as an 8-bit grayscale array (no copy for mode "L" images)."""
+    if image.mode != "L":
+        image = image.convert("L")
+    return np.asarray(image)
+
+
+def _window_sums(values: np.ndarray, half: int, axis: int) -> np.ndarray:
+    """
+    Sum values over half pixels on both sides of every pixel along axis, cut
+    at the edges, from uint32 running sums. The running sums may wrap around
+    on large pages, but their differences stay exact as long as a window sums
+    to less than 2**32.
+    """
+    running = np.moveaxis(np.cumsum(values, axis=axis, dtype=np.uint32), axis, 0)
+    length = running.shape[0]
+    sums = np.empty_like(running)
+    if half < length:
+        sums[:length - half] = running[half:]
+    sums[max(0, length - half):] = running[-1]
+    if half + 1 < length:
+        sums[half + 1:] -= running[:length - half - 1]
+    return np.moveaxis(sums, 0, axis)
+
+
+def _window_lengths(length: int, half: int) -> np.ndarray:
+    positions = np.arange(length)
+    return np.minimum(positions + half, length - 1) - np.maximum(positions - half, 0) + 1
+
+
+def binarize(gray: np.ndarray, window: int, threshold: float = OCR_BINARIZE_THRESHOLD) -> np.ndarray:
+    """
+    Adaptive (Bradley) thresholding: a pixel is ink (0) when it is darker than
+    the mean of the window x window square around it by more than threshold,
+    otherwise paper (255). Local means come from running sums, so the cost
+    does not depend on the window size, and uneven lighting or yellowed paper
+    does not turn whole regions black as a global threshold would.
+
+    The window sums are computed one axis at a time in uint32 and the window
+    areas are broadcast from their row and column lengths, which keeps the
+    peak at about 12 bytes per pixel.
+    """
+    height, width = gray.shape
+    half = max(1, window // 2)
+    means = _window_sums(_window_sums(gray, half, axis=0), half, axis=1).astype(np.float32)
+    means /= _window_lengths(height, half)[:, None]
+    means /= _window_lengths(width, half)[None, :]
+    means *= 1 - threshold
+    binary = np.full(gray.shape, 255, dtype=np.uint8)
+    binary[gray < means] = 0
+    return binary
+
+
+def ink_ratio(binary: np.ndarray) -> float:
+    return float(np.count_nonzero(binary == 0)) / binary.size
+
+
+def estimate_skew(binary: np.ndarray, max_degrees: float = OCR_MAX_SKEW_DEGREES,
+                  step: float = OCR_SKEW_STEP_DEGREES) -> float:
+    """
+    Estimate the skew of the text lines by projection profiles: the ink pixels
+    are projected onto the vertical axis along every candidate angle, and the
+    angle whose profile is the most peaked (lines and gaps best separated) wins.
+
+    Returns:
+        float: Degrees to rotate the page counter-clockwise (PIL's rotate) to straighten it
+    """
+    ys, xs = np.nonzero(binary == 0)
+    if ys.size < 2:
+        return 0.0
+    if ys.size > OCR_SKEW_SAMPLE_PIXELS:
+        keep = np.random.default_rng(0).choice(ys.size, OCR_SKEW_SAMPLE_PIXELS, replace=False)
+        ys, xs = ys[keep], xs[keep]
+
+    angles = np.arange(-max_degrees, max_degrees + step / 2, step)
+    slopes = np.tan(np.radians(angles))
+    offset = int(np.ceil(binary.shape[1] * np.abs(slopes).max())) + 1
+    scores = []
+    for slope in slopes:
+        projected = np.rint(ys - xs * slope).astype(np.int64) + offset
+        counts = np.bincount(projected)
+        scores.append(float(np.dot(counts, counts)))
+    return float(angles[int(np.argmax(scores))])
+
+
+def preprocess_page(image: Image.Image, dpi: int):
+    """
+    Prepare a rendered page for tesseract: grayscale, adaptive binarization,
+    blank-page detection and deskew. The resolution is left alone; pages are
+    rendered at no more than OCR_TARGET_DPI in the first place.
+
+    Args:
+        image: Rendered page
+        dpi: Resolution the page was rendered at
+
+    Returns:
+        tuple: (image to OCR, or None when the page is blank, stats dict with its resolution)
+    """
+    started = time.perf_counter()
+    gray = to_grayscale(image)
+    binary = binarize(gray, max(3, int(dpi * OCR_BINARIZE_WINDOW_INCHES)))
+    stats = {"pixels_in": image.width * image.height, "pixels_out": binary.size, "dpi": dpi, "skew": 0.0, "blank": False}
+    if ink_ratio(binary) < OCR_BLANK_INK_RATIO:
+        stats["blank"] = True
+        stats["seconds"] = time.perf_counter() - started
+        return None, stats
+
+    page = Image.fromarray(binary)
+    skew = estimate_skew(binary)
+    if abs(skew) >= OCR_MIN_DESKEW_DEGREES:
+        page = page.rotate(skew, resample=Image.NEAREST, expand=True, fillcolor=255)
+        stats["skew"] = skew
+    stats["seconds"] = time.perf_counter() - started
+    return page, stats
@@ -0,0 +1,888 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prompts import system_prompt_doc, system_prompt_excel
+from services.analysisState import INCREMENTAL_ANALYSIS, analysis_fingerprint, file_signature, load_state, save_state
+from services.analyzer import (
+    MAX_FILES_PER_CHUNK,
+    MAX_TOKENS_PER_API_CALL,
+    MAX_TOKENS_PER_CHUNK,
+    TOKEN_SAFETY_BUFFER,
+    analyze_chunk_with_logging,
+    analyze_documents_with_retries,
+    clean_json_string,
+    count_tokens,
+    estimate_document_tokens,
+    process_hierarchical_data,
+    split_into_chunks,
+)
+from services.combineDocAnalysis import combine_doc_analyses
+from services.comgineExcelAnalysis import combine_excel_analyses
+from services.dag import Stage, run_dag
+from services.duplicates import DEDUPLICATE_FILES, DuplicateIndex, group_by_metadata
+from services.extractionPool import EXTRACTION_PROCESSES, extract_content_pooled
+from services.extractContent import EXTRACTOR_VERSION, is_extraction_error, ocr_settings
+from services.llmCache import bypass_llm_cache
+from services.localMirror import local_mirror
+from services.files import (
+    BULK_DOWNLOADS,
+    IN_MEMORY_DOWNLOADS,
+    checksum_of,
+    MAX_CONCURRENT_DOWNLOADS,
+    download_archive,
+    download_budget,
+    download_concurrency,
+    download_files,
+    download_single_file,
+    filter_skipped_files,
+    forget_downloads,
+    get_all_files,
+    get_directory_list,
+    plan_archive_batches,
+)
+from services.progress import current_tracker, emit, labels, propagate_context, stage
+from services.rateLimiter import MAX_CONCURRENT_LLM_CALLS
+from services.saveJosn import write_extracted_content_json
+from services.treeIndex import TARGETED_CRAWL, tree_index
+
+UPLOAD_DIR = "temp_uploads"
+
+PIPELINED_ANALYSIS = True  # Stream files through download -> extract -> analyze instead of running each stage to completion
+EXTRACTION_WORKERS = max(2, EXTRACTION_PROCESSES)  # Extractions running at the same time (one per worker process), across all runs
+EXTRACT_QUEUE_SIZE = 20  # Downloaded files waiting for extraction
+ANALYZE_QUEUE_SIZE = 20  # Extracted documents waiting for chunk planning
+
+MAX_CONCURRENT_BATCH_DIRECTORIES = 4  # Directories of one batch analyzed at the same time
+
+_STAGE_DONE = object()  # Sentinel passed through the stage queues once a stage has no more items
+
+
+class _Failed:
+    """Passed down the stages instead of a document for files that could not be downloaded or extracted."""
+
+    def __init__(self, paths: List[str]):
+        self.paths = paths
+
+# Shared by every run (single and batch) so that concurrent analyses respect one global cap.
+# Downloads are capped in services/files.py and OpenAI calls in services/analyzeDocuments.py.
+_extraction_slots = threading.BoundedSemaphore(EXTRACTION_WORKERS)
+_analysis_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS, thread_name_prefix="chunk-analysis")
+
+
+def run_analysis(directory_name: str, file_tree: Optional[List] = None, refresh: bool = False) -> dict:
+    """
+    Run the full analysis for a single directory on the file server.
+
+    Downloads every file of the directory into a fresh folder under UPLOAD_DIR,
+    extracts their content, analyzes it and combines the Excel and document
+    analyses. The temporary folder is always removed afterwards.
+
+    This function is blocking and is meant to be executed on a worker thread
+    (see services/jobs.py), never directly on the event loop.
+
+    Args:
+        directory_name: Name of the directory to analyze
+        file_tree: Already crawled file server tree (as returned by listFiles);
+                   looked up through the tree index when omitted
+        refresh: Ignore the cached tree, cached OpenAI responses and stored
+                 per-file analyses and analyze everything again
+
+    Returns:
+        dict: The response payload with the combined analyses
+    """
+    str_folder_name = str(uuid.uuid4())
+
+    try:
+        start_time = time.time()
+        with bypass_llm_cache(refresh), download_budget(), download_concurrency():
+            results = run_dag(build_analysis_graph(directory_name, str_folder_name, file_tree, refresh))
+
+        total_time = time.time() - start_time  # Execution time in seconds
+        result = {
+            "success": True,
+            "title": directory_name,
+            "excel": results["combine_excel"],
+            "doc": results["combine_doc"],
+            "time_taken_seconds": round(total_time, 2)
+        }
+        tracker = current_tracker()
+        if tracker is not None:
+            result["stage_timings"] = tracker.stage_timings()
+        return result
+
+    finally:
+        cleanup_folder(str_folder_name)
+
+
+def run_batch_analysis(directory_names: List[str], refresh: bool = False) -> dict:
+    """
+    Analyze several directories of the file server in one run.
+
+    The file server tree is read once (from the tree index when it is still
+    valid) and shared by every directory.
+    Up to MAX_CONCURRENT_BATCH_DIRECTORIES directories are analyzed at the same
+    time; their downloads, extractions and OpenAI calls go through the same
+    process-wide caps as single analyses. Each directory result is published on
+    the progress tracker as soon as it completes.
+
+    Args:
+        directory_names: Names of the directories to analyze
+        refresh: Ignore the cached tree and cached OpenAI responses and analyze everything again
+
+    Returns:
+        dict: {"success": True, "results": [per-directory payloads], "time_taken_seconds": ...}
+    """
+    start_time = time.time()
+    directory_names = list(dict.fromkeys(str(name) for name in directory_names))
+
+    with stage("crawl_tree"):
+        file_tree = tree_index.get_tree(refresh)
+
+    def analyze_one(directory_name: str) -> dict:
+        with labels(directory=directory_name):
+            return run_analysis(directory_name, file_tree, refresh)
+
+    results: Dict[str, dict] = {}
+    # Every directory of the batch draws from the same download budget and concurrency limit
+    with download_budget(), download_concurrency():
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCH_DIRECTORIES, thread_name_prefix="batch") as executor:
+            future_to_name = {
+                executor.submit(propagate_context(analyze_one), directory_name): directory_name
+                for directory_name in directory_names
+            }
+            for future in as_completed(future_to_name):
+                directory_name = future_to_name[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error analyzing directory '{directory_name}': {str(e)}")
+                    result = {"success": False, "title": directory_name, "message": str(e)}
+                results[directory_name] = result
+                tracker = current_tracker()
+                if tracker is not None:
+                    tracker.publish_result(directory_name, result)
+                print(f"Batch: {len(results)}/{len(directory_names)} directories done")
+
+    return {
+        "success": True,
+        "results": [results[name] for name in directory_names],
+        "time_taken_seconds": round(time.time() - start_time, 2)
+    }
+
+
+def build_analysis_graph(
+    directory_name: str,
+    folder_name: str,
+    file_tree: Optional[List] = None,
+    refresh: bool = False
+) -> List[Stage]:
+    """
+    Describe the analysis of one directory as a graph of stages.
+
+    crawl -> analyze_files -> (combine_excel, combine_doc)
+
+    The two combine stages only read final_result.json, so run_dag runs them
+    concurrently.
+
+    Args:
+        directory_name: Name of the directory to analyze
+        folder_name: Name of the working folder under UPLOAD_DIR
+        file_tree: Already crawled file server tree, if any
+        refresh: Analyze every file again instead of reusing stored analyses
+
+    Returns:
+        List of stages for run_dag
+    """
+    return [
+        Stage("crawl", lambda inputs: crawl_directory(directory_name, file_tree, refresh)),
+        Stage("analyze_files", lambda inputs: analyze_files(inputs["crawl"], folder_name, directory_name, refresh),
+              deps=["crawl"]),
+        Stage("combine_excel", lambda inputs: combine_excel(inputs["analyze_files"]), deps=["analyze_files"]),
+        Stage("combine_doc", lambda inputs: combine_doc(inputs["analyze_files"]), deps=["analyze_files"]),
+    ]
+
+
+def crawl_directory(
+    directory_name: str,
+    file_tree: Optional[List] = None,
+    refresh: bool = False
+) -> List[Tuple[str, Dict]]:
+    """
+    Find a directory on the file server and list all of its files.
+
+    Without a file tree, the cached tree index is used. In targeted mode only
+    the path to the directory and its own subtree are read from the file server.
+
+    Args:
+        directory_name: Name of the directory to find
+        file_tree: Already crawled file server tree, if any
+        refresh: Crawl again even if a cached tree is still valid
+
+    Returns:
+        List of (relative_path, metadata) tuples
+
+    Raises:
+        ValueError: If the directory does not exist
+    """
+    print("directory", directory_name)
+    if file_tree is not None:
+        target_dir = get_directory_list(file_tree, directory_name)
+    elif TARGETED_CRAWL:
+        target_dir = tree_index.get_directory(directory_name, refresh)
+    else:
+        target_dir = get_directory_list(tree_index.get_tree(refresh), directory_name)
+    if target_dir is None:
+        raise ValueError(f"Directory '{directory_name}' not found on the file server")
+
+    all_file_urls = get_all_files(target_dir)
+    emit("files_discovered", counters={"files_discovered": len(all_file_urls)}, files=len(all_file_urls))
+    return all_file_urls
+
+
+def analyze_files(
+    file_tuples: List[Tuple[str, Dict]],
+    folder_name: str,
+    directory_name: Optional[str] = None,
+    refresh: bool = False
+) -> str:
+    """
+    Download, extract and analyze files, returning the path of final_result.json.
+
+    When INCREMENTAL_ANALYSIS is on, the state of the previous run of the same
+    directory is reused unless refresh is set.
+    """
+    if PIPELINED_ANALYSIS:
+        state_key = directory_name if INCREMENTAL_ANALYSIS else None
+        return run_streaming_pipeline(
+            file_tuples, folder_name, system_prompt_excel, system_prompt_doc,
+            state_key=state_key, reuse_state=not refresh
+        )
+
+    # Download the files
+    with stage("download"):
+        downloaded_files = download_files(file_tuples, folder_name)
+    print("Downloaded files:", downloaded_files)
+
+    with stage("extract"):
+        result_location = write_extracted_content_json(folder_name)
+    with stage("analyze"):
+        return process_hierarchical_data(result_location, system_prompt_excel, system_prompt_doc)
+
+
+def combine_excel(final_result_location: str) -> List[Dict]:
+    combinedExcelAnalysis = combine_excel_analyses(final_result_location)
+    emit("partial_result", kind="excel", result=combinedExcelAnalysis)
+    return combinedExcelAnalysis
+
+
+def combine_doc(final_result_location: str) -> Dict:
+    combinedDocAnalysis = combine_doc_analyses(final_result_location)
+    emit("partial_result", kind="doc", result=combinedDocAnalysis)
+    return combinedDocAnalysis
+
+
+def _start_stage(
+    name: str,
+    fn: Callable[[Any], Any],
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    workers: int,
+    cancelled: Optional[threading.Event] = None
+) -> List[threading.Thread]:
+    """
+    Start a pipeline stage: `workers` threads applying fn to every item of in_queue.
+
+    Non-None results are put on out_queue. Once in_queue yields the _STAGE_DONE
+    sentinel and all workers have drained, the sentinel is forwarded to out_queue.
+    Because the queues are bounded, a slow stage applies back-pressure upstream.
+    Once cancelled is set, the remaining items are dropped without calling fn,
+    so the stage runs out quickly. The stage is timed on the progress tracker
+    of the calling run.
+    """
+    remaining = [workers]
+    remaining_lock = threading.Lock()
+    tracker = current_tracker()
+    if tracker is not None:
+        tracker.stage_started(name)
+
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is _STAGE_DONE:
+                # Put the sentinel back so sibling workers see it as well
+                in_queue.put(_STAGE_DONE)
+                with remaining_lock:
+                    remaining[0] -= 1
+                    last_worker = remaining[0] == 0
+                if last_worker:
+                    if tracker is not None:
+                        tracker.stage_finished(name)
+                    out_queue.put(_STAGE_DONE)
+                return
+            if cancelled is not None and cancelled.is_set():
+                continue
+            try:
+                result = fn(item)
+            except Exception as e:
+                print(f"Error in {name} stage: {str(e)}")
+                result = None
+            if result is not None:
+                out_queue.put(result)
+
+    threads = [
+        threading.Thread(target=propagate_context(worker), name=f"{name}-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+class _FolderAnalysis:
+    """
+    Documents, chunk plan and in-flight analyses of one top-level folder.
+
+    The folder is planned once every one of its files has been extracted (or
+    has failed), the same way analyze_folder does: in a single batch when all
+    documents fit in one call, otherwise in chunks filled largest document
+    first. Both need every document of the folder, and the files of an
+    analyzed directory all sit in one top-level folder (the directory itself),
+    so its analysis starts only after the last file was downloaded and
+    extracted. Streaming overlaps the downloads with the extractions.
+    """
+
+    def __init__(self, folder_name: str, max_chunk_tokens: int, max_files_per_chunk: int):
+        self.folder_name = folder_name
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_files_per_chunk = max_files_per_chunk
+        self.documents: List[Dict] = []
+        self.to_plan: List[Dict] = []  # Documents to analyze, planned once the folder is complete
+        self.pending: set = set()  # Paths still going through download and extraction
+        self.planned = False
+        self.chunks: List[List[Dict]] = []
+        self.chunk_futures: List[Tuple[Future, Future]] = []
+
+    def deliver(self, path: str) -> bool:
+        """Mark a file of the folder as done; returns whether the folder is now ready to be planned."""
+        self.pending.discard(path)
+        return not self.pending and not self.planned
+
+    def plan(self, executor: ThreadPoolExecutor, system_prompt_excel: str, system_prompt_doc: str) -> None:
+        if self.pending:
+            print(f"Planning folder '{self.folder_name}' with {len(self.pending)} files missing")
+        self.planned = True
+        documents, self.to_plan = self.to_plan, []
+        if not documents:
+            return
+        total_tokens = sum(estimate_document_tokens(doc) for doc in documents)
+        available_tokens = (MAX_TOKENS_PER_API_CALL - count_tokens(system_prompt_excel)
+                            - count_tokens(system_prompt_doc) - TOKEN_SAFETY_BUFFER)
+        # Reused chunks already make this a combined analysis, so new documents are chunked as well
+        if not self.chunk_futures and total_tokens <= available_tokens and len(documents) <= self.max_files_per_chunk:
+            self.submit_chunk(documents, executor, system_prompt_excel, system_prompt_doc, 1, single_batch=True)
+            return
+        chunks = split_into_chunks(documents, self.max_chunk_tokens, self.max_files_per_chunk)
+        total_chunks = len(self.chunk_futures) + len(chunks)
+        for chunk in chunks:
+            self.submit_chunk(chunk, executor, system_prompt_excel, system_prompt_doc, total_chunks)
+
+    def reuse_chunk(self, chunk: List[Dict], excel_analysis: Dict, doc_analysis: Dict) -> None:
+        """Add a chunk whose analyses were stored by a previous run."""
+        self.documents.extend(chunk)
+        self.chunks.append(chunk)
+        excel_future: Future = Future()
+        excel_future.set_result(excel_analysis)
+        doc_future: Future = Future()
+        doc_future.set_result(doc_analysis)
+        self.chunk_futures.append((excel_future, doc_future))
+        emit("chunk_reused", counters={"chunks_reused": 1}, folder=self.folder_name,
+             files=[doc.get("path") for doc in chunk])
+
+    def submit_chunk(self, chunk: List[Dict], executor: ThreadPoolExecutor, system_prompt_excel: str,
+                     system_prompt_doc: str, total_chunks: int, single_batch: bool = False) -> None:
+        chunk_num = len(self.chunk_futures) + 1
+        print(f"Planned chunk {chunk_num}/{total_chunks} for folder '{self.folder_name}' ({len(chunk)} files"
+              f"{', single batch' if single_batch else ''})")
+        emit("chunk_planned", counters={"chunks_planned": 1}, folder=self.folder_name, chunk=chunk_num,
+             files=[doc.get("path") for doc in chunk])
+        if single_batch:
+            # As in analyze_folder: each pass gets its own copies since retries may truncate documents in place
+            analyze_batch = propagate_context(analyze_documents_with_retries)
+            excel_future = executor.submit(analyze_batch, [dict(doc) for doc in chunk], system_prompt_excel)
+            doc_future = executor.submit(analyze_batch, [dict(doc) for doc in chunk], system_prompt_doc)
+        else:
+            analyze_chunk = propagate_context(analyze_chunk_with_logging)
+            excel_future = executor.submit(
+                analyze_chunk, chunk, system_prompt_excel, chunk_num, total_chunks, "Excel analysis"
+            )
+            doc_future = executor.submit(
+                analyze_chunk, chunk, system_prompt_doc, chunk_num, total_chunks, "Document analysis"
+            )
+        self._report_when_done(excel_future, chunk_num, "excel")
+        self._report_when_done(doc_future, chunk_num, "doc")
+        self.chunks.append(chunk)
+        self.chunk_futures.append((excel_future, doc_future))
+
+    def _report_when_done(self, future: Future, chunk_num: int, kind: str) -> None:
+        """Publish the chunk analysis as a partial result as soon as it is available."""
+        if current_tracker() is None:
+            return
+
+        def report(done_future: Future):
+            if done_future.exception() is None:
+                emit("chunk_analyzed", counters={"chunks_analyzed": 1}, folder=self.folder_name,
+                     chunk=chunk_num, kind=kind, result=done_future.result())
+
+        # Callbacks run outside the submitting context, so carry it over explicitly
+        future.add_done_callback(propagate_context(report))
+
+    def collect(self) -> Dict:
+        """Wait for all chunk analyses and return them in the analyze_folder format."""
+        if not self.chunk_futures:
+            print(f"No documents found in folder: {self.folder_name}")
+            return {
+                "excel_analysis": {"error": "No documents found in folder"},
+                "doc_analysis": {"error": "No documents found in folder"}
+            }
+
+        excel_results = [_future_result(excel_future) for excel_future, _ in self.chunk_futures]
+        doc_results = [_future_result(doc_future) for _, doc_future in self.chunk_futures]
+
+        if len(self.chunk_futures) == 1:
+            return {"excel_analysis": excel_results[0], "doc_analysis": doc_results[0]}
+
+        return {
+            "excel_analysis": {"combined_analysis": True, "chunks": excel_results},
+            "doc_analysis": {"combined_analysis": True, "chunks": doc_results}
+        }
+
+    def successful_chunks(self) -> List[Tuple[List[Dict], Dict, Dict]]:
+        """Return (documents, excel analysis, doc analysis) of every chunk analyzed without error."""
+        successful = []
+        for chunk, (excel_future, doc_future) in zip(self.chunks, self.chunk_futures):
+            excel_result = _future_result(excel_future)
+            doc_result = _future_result(doc_future)
+            if _is_error(excel_result) or _is_error(doc_result):
+                continue
+            successful.append((chunk, excel_result, doc_result))
+        return successful
+
+
+def _folder_of(folders: Dict[str, "_FolderAnalysis"], path: str) -> Optional["_FolderAnalysis"]:
+    parts = path.strip("/").split("/")
+    return folders.get(parts[0]) if len(parts) > 1 else None
+
+
+def _is_error(result: Any) -> bool:
+    return not isinstance(result, (dict, list)) or (isinstance(result, dict) and "error" in result)
+
+
+def _future_result(future: Future) -> Dict:
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Error processing chunk: {str(e)}")
+        return {"error": str(e)}
+
+
+def run_streaming_pipeline(
+    file_tuples: List[Tuple[str, Dict]],
+    folder_name: str,
+    system_prompt_excel: str,
+    system_prompt_doc: str,
+    max_chunk_tokens: int = MAX_TOKENS_PER_CHUNK,
+    max_files_per_chunk: int = MAX_FILES_PER_CHUNK,
+    state_key: Optional[str] = None,
+    reuse_state: bool = True
+) -> str:
+    """
+    Download, extract and analyze files as a streaming pipeline.
+
+    Each file is handed to extraction as soon as its download finishes, and each
+    extracted document goes to its top-level folder. A folder is chunked
+    exactly like analyze_folder does, which needs all of its documents, so it
+    is sent for analysis once its last file is extracted. The files of an
+    analyzed directory share one top-level folder, so the analysis waits for
+    the whole directory; what streams is the extraction, which starts on the
+    first downloaded file instead of after the last one.
+
+    With a state_key, the run is incremental: files whose size and modification
+    date match the stored state of a previous run are neither downloaded nor
+    extracted again, and chunks made only of such files reuse their stored
+    analyses. Only new or changed files (plus unchanged files that shared a
+    chunk with them) are analyzed. The state is updated at the end of the run.
+
+    The output is the same final_result.json that process_hierarchical_data
+    writes, so combine_excel_analyses / combine_doc_analyses work unchanged.
+
+    Args:
+        file_tuples: (relative_path, metadata) tuples as returned by get_all_files
+        folder_name: Name of the working folder under UPLOAD_DIR
+        system_prompt_excel: System prompt for Excel analysis
+        system_prompt_doc: System prompt for document analysis
+        max_chunk_tokens: Maximum tokens per content chunk
+        max_files_per_chunk: Maximum files per chunk
+        state_key: Key of the stored per-directory state (usually the directory name)
+        reuse_state: Whether the stored state may be reused (False still saves a fresh state)
+
+    Returns:
+        str: Path of the final_result.json file
+    """
+    base_folder = os.path.join(UPLOAD_DIR, folder_name)
+    os.makedirs(base_folder, exist_ok=True)
+
+    filtered_file_tuples, skipped_files = filter_skipped_files(file_tuples)
+    print(f"Streaming {len(filtered_file_tuples)} files through the pipeline (skipped {len(skipped_files)} audio/video files)")
+
+    # Every top-level folder that had files shows up in the result, even if all downloads fail
+    folders: Dict[str, _FolderAnalysis] = {}
+    for rel_path, _ in filtered_file_tuples:
+        parts = rel_path.strip("/").split("/")
+        if len(parts) > 1 and parts[0] not in folders:
+            folders[parts[0]] = _FolderAnalysis(parts[0], max_chunk_tokens, max_files_per_chunk)
+    root_documents: List[Dict] = []
+
+    # Split the files into unchanged ones (taken from the stored state) and the ones to fetch
+    fingerprint = analysis_fingerprint(
+        system_prompt_excel, system_prompt_doc, max_chunk_tokens, max_files_per_chunk, EXTRACTOR_VERSION,
+        ocr_settings()
+    )
+    state = {"files": {}, "chunks": []}
+    if state_key is not None and reuse_state:
+        state = load_state(state_key, fingerprint)
+    unchanged: Dict[str, Dict] = {}
+    to_fetch: List[Tuple[str, Dict]] = []
+    # Content hash of every document, kept out of the documents since they are sent to the LLM as they are
+    content_hashes: Dict[str, Optional[str]] = {}
+    for rel_path, metadata in filtered_file_tuples:
+        stored = state["files"].get(rel_path)
+        signature = file_signature(metadata)
+        if stored is not None and signature is not None and stored.get("signature") == signature:
+            unchanged[rel_path] = {"path": rel_path, "file": os.path.basename(rel_path), "content": stored.get("content")}
+            content_hashes[rel_path] = stored.get("sha256")
+        else:
+            to_fetch.append((rel_path, metadata))
+
+    # Likely copies (same name, exact size and date) are not downloaded; they get the content of the file kept
+    duplicates = DuplicateIndex()
+    copies: Dict[str, List[Tuple[str, Dict]]] = {}
+    if DEDUPLICATE_FILES:
+        to_fetch, copies = group_by_metadata(to_fetch)
+        copy_count = sum(len(copy_tuples) for copy_tuples in copies.values())
+        if copy_count:
+            print(f"Skipping download of {copy_count} copies of other files")
+            emit("duplicates_planned", counters={"duplicate_downloads_skipped": copy_count}, files=copy_count)
+
+    download_queue: queue.Queue = queue.Queue()
+    extract_queue: queue.Queue = queue.Queue(maxsize=EXTRACT_QUEUE_SIZE)
+    analyze_queue: queue.Queue = queue.Queue(maxsize=ANALYZE_QUEUE_SIZE)
+    # With a local mirror, files whose copy is current are read from it and only the others are transferred
+    mirrored: List[Tuple[str, Dict]] = []
+    if local_mirror is not None:
+        local_mirror.prune({rel_path.strip("/").split("/")[0] for rel_path, _ in file_tuples},
+                           [rel_path for rel_path, _ in file_tuples])
+        mirrored, to_fetch = local_mirror.split(to_fetch)
+        print(f"Local mirror: {len(mirrored)} files up to date, {len(to_fetch)} to transfer")
+        emit("mirror_plan", mirrored_files=len(mirrored), transferred_files=len(to_fetch))
+
+    # Archive batches are fetched one at a time by their own worker while the
+    # download workers take the single files; the archive stage closes the
+    # download queue once its failed files were queued for single downloads
+    archive_queue: queue.Queue = queue.Queue()
+    if BULK_DOWNLOADS:
+        batches, singles = plan_archive_batches(to_fetch)
+    else:
+        batches, singles = [], to_fetch
+    singles = mirrored + singles
+    for batch in batches:
+        archive_queue.put(batch)
+    archive_queue.put(_STAGE_DONE)
+    for file_tuple in singles:
+        download_queue.put(file_tuple)
+
+    def failed(rel_path: str) -> _Failed:
+        return _Failed([rel_path] + [path for path, _ in copies.get(rel_path, [])])
+
+    def fetch(rel_path: str, metadata: Dict):
+        # When the kept file fails, its copies are tried in turn and the first one is kept instead,
+        # with the paths that failed before it as its copies
+        candidates = [(rel_path, metadata)] + copies.get(rel_path, [])
+        for index, (path, path_metadata) in enumerate(candidates):
+            if local_mirror is not None:
+                file_path = local_mirror.download_file(path, path_metadata)
+            else:
+                file_path = download_single_file(path, path_metadata, base_folder, in_memory=IN_MEMORY_DOWNLOADS)
+            if file_path is not None:
+                if index > 0:
+                    copies.pop(rel_path, None)
+                    copies[path] = candidates[:index] + candidates[index + 1:]
+                return path, file_path
+        return None
+
+    def on_archive_file(rel_path: str, file_path: str) -> None:
+        extract_queue.put((rel_path, file_path))
+
+    def archive_stage(batch):
+        # Files go to extraction as soon as they are unpacked; failures are downloaded one by one
+        if local_mirror is not None:
+            failures = local_mirror.download_archive(batch, on_archive_file)
+        else:
+            failures = download_archive(batch, base_folder, on_archive_file, in_memory=IN_MEMORY_DOWNLOADS)
+        for file_tuple in failures:
+            download_queue.put(file_tuple)
+        return None
+
+    # In memory mode the extract queue holds file contents, so its size also bounds memory use
+    def download_stage(file_tuple):
+        return fetch(*file_tuple) or failed(file_tuple[0])
+
+    def extract_stage(downloaded):
+        if isinstance(downloaded, _Failed):
+            return downloaded
+        rel_path, file_path = downloaded
+
+        def extract() -> str:
+            with _extraction_slots:
+                return extract_content_pooled(file_path)
+
+        # Copies found by metadata share a key even when the download left no checksum
+        content_hash = (checksum_of(file_path) or f"path:{rel_path}") if DEDUPLICATE_FILES else None
+        try:
+            if content_hash is not None:
+                content, reused = duplicates.extract_once(content_hash, extract)
+                if reused:
+                    emit("duplicate_extraction_skipped", counters={"duplicate_extractions_skipped": 1}, path=rel_path)
+            else:
+                content = extract()
+        except Exception as e:
+            print(f"Error extracting {rel_path}: {str(e)}")
+            return failed(rel_path)
+        emit("file_extracted", counters={"files_extracted": 1}, path=rel_path, characters=len(content or ""))
+        for copy_path, _ in copies.get(rel_path, []):
+            content_hashes[copy_path] = content_hash
+            analyze_queue.put(clean_json_string({
+                "path": copy_path,
+                "file": os.path.basename(copy_path),
+                "content": content
+            }))
+        content_hashes[rel_path] = content_hash
+        return clean_json_string({
+            "path": rel_path,
+            "file": os.path.basename(rel_path),
+            "content": content
+        })
+
+    # Every file that goes through the stages has to come out (as a document or as _Failed) before its folder is planned
+    for rel_path, _ in to_fetch + mirrored:
+        for path in [rel_path] + [copy_path for copy_path, _ in copies.get(rel_path, [])]:
+            folder = _folder_of(folders, path)
+            if folder is not None:
+                folder.pending.add(path)
+
+    # Set when this thread gives up, so the stage workers stop instead of blocking on the bounded queues
+    cancelled = threading.Event()
+    # Archives are downloaded one at a time process-wide, so a single worker takes them
+    _start_stage("download_archives", archive_stage, archive_queue, download_queue, 1, cancelled)
+    # One worker per possible download; the job's limiter decides how many download at once
+    _start_stage("download", download_stage, download_queue, extract_queue, MAX_CONCURRENT_DOWNLOADS, cancelled)
+    _start_stage("extract", extract_stage, extract_queue, analyze_queue, EXTRACTION_WORKERS, cancelled)
+
+    executor = _analysis_executor
+
+    def delivered(path: str) -> None:
+        folder = _folder_of(folders, path)
+        if folder is not None and folder.deliver(path):
+            folder.plan(executor, system_prompt_excel, system_prompt_doc)
+
+    def plan_document(document: Dict) -> None:
+        folder = _folder_of(folders, document["path"])
+        if folder is None:
+            root_documents.append(document)
+            return
+        # Identical content is analyzed once per folder; the copy is still listed in the result
+        first_path = duplicates.claim(folder.folder_name, content_hashes.get(document["path"]), document["path"])
+        if first_path is not None:
+            document["duplicate_of"] = first_path
+            folder.documents.append(document)
+            emit("duplicate_skipped", counters={"duplicate_analyses_skipped": 1}, path=document["path"],
+                 duplicate_of=first_path)
+            return
+        folder.documents.append(document)
+        folder.to_plan.append(document)
+
+    def plan_incoming() -> None:
+        # Unchanged files first: they are already there
+        if unchanged:
+            reused_paths = set()
+            for stored_chunk in state["chunks"]:
+                paths = stored_chunk.get("files", [])
+                folder = folders.get(stored_chunk.get("folder"))
+                if folder is not None and paths and all(path in unchanged for path in paths):
+                    folder.reuse_chunk([unchanged[path] for path in paths],
+                                       stored_chunk["excel_analysis"], stored_chunk["doc_analysis"])
+                    reused_paths.update(paths)
+                    for path in paths:
+                        duplicates.claim(folder.folder_name, content_hashes.get(path), path)
+            # Unchanged files whose chunk has to be redone are planned again without downloading them
+            for rel_path, document in unchanged.items():
+                if rel_path not in reused_paths:
+                    plan_document(document)
+            print(f"Incremental analysis: {len(unchanged)} unchanged files, {len(to_fetch)} new or changed files, "
+                  f"{len(reused_paths)} files in reused chunks")
+            emit("incremental_plan", unchanged_files=len(unchanged), changed_files=len(to_fetch),
+                 reused_files=len(reused_paths))
+        for folder in folders.values():
+            if not folder.pending:
+                folder.plan(executor, system_prompt_excel, system_prompt_doc)
+
+        while True:
+            item = analyze_queue.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _Failed):
+                for path in item.paths:
+                    delivered(path)
+                continue
+            plan_document(item)
+            delivered(item["path"])
+
+    with stage("analyze"):
+        # Chunk planning runs on this thread; analysis calls run on the shared executor
+        try:
+            plan_incoming()
+        except BaseException:
+            cancelled.set()
+            while analyze_queue.get() is not _STAGE_DONE:
+                pass
+            raise
+
+        # Files lost by a stage error are not waited for
+        for folder in folders.values():
+            if not folder.planned:
+                folder.plan(executor, system_prompt_excel, system_prompt_doc)
+
+        result = {"directory": folder_name, "files": []}
+        entries = list(folders.items())
+        entries += [(document["file"], document) for document in root_documents]
+        for _, entry in sorted(entries, key=lambda item: item[0]):
+            if isinstance(entry, _FolderAnalysis):
+                result["files"].append({
+                    "directory": entry.folder_name,
+                    "files": build_content_tree(entry.documents, depth=1),
+                    "analysis": entry.collect()
+                })
+            else:
+                result["files"].append({"file": entry["file"], "content": entry["content"]})
+
+    output_path = os.path.join(base_folder, "final_result.json")
+    with open(output_path, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if state_key is not None:
+        metadata_by_path = dict(filtered_file_tuples)
+        try:
+            save_state(state_key, _build_state(fingerprint, folders, root_documents, metadata_by_path, content_hashes))
+        except Exception as e:
+            print(f"Could not save analysis state for '{state_key}': {str(e)}")
+
+    print(f"Analysis complete. Results saved to {output_path}")
+    return output_path
+
+
+def _build_state(
+    fingerprint: str,
+    folders: Dict[str, _FolderAnalysis],
+    root_documents: List[Dict],
+    metadata_by_path: Dict[str, Dict],
+    content_hashes: Optional[Dict[str, Optional[str]]] = None
+) -> Dict[str, Any]:
+    """Collect file signatures, extracted content, content hashes and successful chunk analyses for the next run."""
+    state = {"fingerprint": fingerprint, "files": {}, "chunks": []}
+    documents = root_documents + [doc for folder in folders.values() for doc in folder.documents]
+    for document in documents:
+        signature = file_signature(metadata_by_path.get(document["path"], {}))
+        # Failed extractions may come from a transient error, so such files are fetched again next time
+        if signature is not None and not is_extraction_error(document.get("content")):
+            state["files"][document["path"]] = {
+                "signature": signature,
+                "content": document["content"],
+                "sha256": (content_hashes or {}).get(document["path"])
+            }
+
+    for folder in folders.values():
+        for chunk, excel_result, doc_result in folder.successful_chunks():
+            paths = [doc["path"] for doc in chunk]
+            # Chunks with files we cannot recognize next time would never be reused
+            if all(path in state["files"] for path in paths):
+                state["chunks"].append({
+                    "folder": folder.folder_name,
+                    "files": paths,
+                    "excel_analysis": excel_result,
+                    "doc_analysis": doc_result
+                })
+    return state
+
+
+def build_content_tree(documents: List[Dict], depth: int = 0) -> List[Dict]:
+    """
+    Rebuild the nested {"directory": ..., "files": [...]} structure written by
+    write_extracted_content_json from a flat list of extracted documents.
+
+    Args:
+        documents: Documents with "path", "file" and "content" (and "duplicate_of" for copies)
+        depth: Number of leading path components to strip
+
+    Returns:
+        List of file and directory entries, sorted by name at every level
+    """
+    root: Dict[str, Any] = {}
+    for document in documents:
+        parts = document["path"].strip("/").split("/")[depth:]
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        # Directories are dicts, files are stored as their document (in a tuple, to tell them apart)
+        node[parts[-1]] = (document,)
+
+    def to_entries(node: Dict[str, Any]) -> List[Dict]:
+        entries = []
+        for name in sorted(node):
+            child = node[name]
+            if isinstance(child, dict):
+                entries.append({"directory": name, "files": to_entries(child)})
+            else:
+                document = child[0]
+                entry = {"file": name, "content": document["content"]}
+                if document.get("duplicate_of"):
+                    entry["duplicate_of"] = document["duplicate_of"]
+                entries.append(entry)
+        return entries
+
+    return to_entries(root)
+
+
+def cleanup_folder(folder_name: str) -> None:
+    """
+    Remove the temporary download folder of an analysis run.
+
+    Args:
+        folder_name: Name of the folder under UPLOAD_DIR
+    """
+    folder_path = os.path.join(UPLOAD_DIR, folder_name)
+    forget_downloads(folder_path)
+    try:
+        if os.path.exists(folder_path):
+            print(f"Cleaning up temporary folder: {folder_path}")
+            shutil.rmtree(folder_path)
+            print(f"Successfully removed {folder_path}")
+        else:
+            print(f"Folder {folder_path} does not exist, no cleanup needed")
+    except Exception as cleanup_error:
+        print(f"Error during cleanup: {str(cleanup_error)}")
@@ -0,0 +1,194 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+MAX_EVENTS = 5000  # Events kept per tracker for late subscribers
+
+_current_tracker: contextvars.ContextVar = contextvars.ContextVar("progress_tracker", default=None)
+_event_labels: contextvars.ContextVar = contextvars.ContextVar("progress_event_labels", default={})
+
+
+class ProgressTracker:
+    """
+    Collects progress events, counters and per-stage timings of one analysis run.
+
+    Events are kept in order with an increasing sequence number so that several
+    subscribers (e.g. Server-Sent Events streams) can follow the same run and
+    resume from the last event they have seen.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.closed = False
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, Any] = {}
+        self.stages: Dict[str, Dict[str, Optional[float]]] = {}
+        # Stage key -> (directory label, stage name); directories of a batch time their stages separately
+        self._stage_names: Dict[str, tuple] = {}
+        self.partial_results: Dict[str, Any] = {}
+        self._events: deque = deque(maxlen=MAX_EVENTS)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, counters: Optional[Dict[str, float]] = None, **data) -> None:
+        """
+        Record an event.
+
+        Args:
+            event: Event name (e.g. "file_downloaded")
+            counters: Deltas applied to the run counters (e.g. {"bytes_downloaded": 1024})
+            **data: Additional JSON-serializable event data
+        """
+        with self._lock:
+            for name, delta in (counters or {}).items():
+                self.counters[name] = self.counters.get(name, 0) + delta
+            self._seq += 1
+            now = time.time()
+            self._events.append({
+                "seq": self._seq,
+                "event": event,
+                "time": now,
+                "elapsed": round(now - self.started_at, 3),
+                **_event_labels.get(),
+                **data
+            })
+
+    def set_gauge(self, name: str, value: Any) -> None:
+        """Record the current value of a setting that changes during the run (e.g. a concurrency limit)."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def publish_result(self, key: str, result: Any) -> None:
+        """Store a finished part of the run (e.g. one directory of a batch) and announce it."""
+        with self._lock:
+            self.partial_results[key] = result
+        self.emit("result_published", key=key, result=result)
+
+    def _stage(self, name: str, started_at: Optional[float]) -> Dict[str, Optional[float]]:
+        # Stages run under labels(directory=...) are keyed "<directory>/<stage>"
+        directory = _event_labels.get().get("directory")
+        key = f"{directory}/{name}" if directory else name
+        self._stage_names.setdefault(key, (directory, name))
+        return self.stages.setdefault(key, {"started_at": started_at, "finished_at": None, "duration_seconds": None})
+
+    def stage_started(self, name: str) -> None:
+        with self._lock:
+            stage = self._stage(name, None)
+            if stage["started_at"] is None:
+                stage["started_at"] = time.time()
+        self.emit("stage_started", stage=name)
+
+    def stage_finished(self, name: str) -> None:
+        with self._lock:
+            stage = self._stage(name, time.time())
+            stage["finished_at"] = time.time()
+            stage["duration_seconds"] = round(stage["finished_at"] - stage["started_at"], 3)
+            duration = stage["duration_seconds"]
+        self.emit("stage_finished", stage=name, duration_seconds=duration)
+
+    def close(self, status: str) -> None:
+        """Emit the final event; subscribers stop once they have read it."""
+        self.emit("finished", status=status, **self.snapshot())
+        self.closed = True
+
+    def events_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Return all stored events with a sequence number greater than seq."""
+        with self._lock:
+            return [event for event in self._events if event["seq"] > seq]
+
+    def stage_timings(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Return the stage timings of the caller's directory label (the stages
+        run outside labels() when there is none), keyed by stage name.
+        """
+        directory = _event_labels.get().get("directory")
+        with self._lock:
+            return {
+                name: dict(self.stages[key])
+                for key, (stage_directory, name) in self._stage_names.items()
+                if stage_directory == directory
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current counters and stage timings."""
+        with self._lock:
+            return {
+                "elapsed": round(time.time() - self.started_at, 3),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "stages": {name: dict(stage) for name, stage in self.stages.items()}
+            }
+
+
+def current_tracker() -> Optional[ProgressTracker]:
+    """Return the tracker of the run executing on this thread, if any."""
+    return _current_tracker.get()
+
+
+@contextmanager
+def tracking(tracker: ProgressTracker):
+    """Make tracker the current tracker for the code run inside the block."""
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+@contextmanager
+def labels(**event_labels):
+    """Add the given fields (e.g. directory="Alpine VC") to every event emitted inside the block."""
+    token = _event_labels.set({**_event_labels.get(), **event_labels})
+    try:
+        yield
+    finally:
+        _event_labels.reset(token)
+
+
+def emit(event: str, counters: Optional[Dict[str, float]] = None, **data) -> None:
+    """Record an event on the current tracker; does nothing outside a tracked run."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.emit(event, counters, **data)
+
+
+def gauge(name: str, value: Any) -> None:
+    """Set a gauge on the current tracker; does nothing outside a tracked run."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.set_gauge(name, value)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of code as a named stage of the current run."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.stage_started(name)
+    try:
+        yield
+    finally:
+        if tracker is not None:
+            tracker.stage_finished(name)
+
+
+def propagate_context(fn: Callable) -> Callable:
+    """
+    Wrap fn so that it runs with the context variables of the caller.
+
+    Worker threads (thread pools, pipeline stages) do not inherit context
+    variables, so anything submitted to them has to be wrapped for events to
+    reach the tracker of the run that submitted the work.
+    """
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so run on a copy
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))  # Requests per minute of the account tier
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))  # Tokens per minute of the account tier
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "10"))  # In-flight OpenAI requests
+RATE_LIMIT_PAUSE_SECONDS = 10  # Pause after a 429 that carries no Retry-After header
+OPENAI_RETRIES = 3  # Retries of a call after a 429, a timeout or a server error, each admitted again
+OPENAI_BACKOFF_SECONDS = 1  # Delay before retrying a timeout or server error, doubled on every attempt
+
+# Lower values are admitted first. Consolidation calls finish a run that has
+# already paid for its chunk calls, so they go ahead of new chunks.
+CALL_PRIORITIES = {"consolidation": 0, "single": 1, "chunk": 2}
+DEFAULT_PRIORITY = 2
+
+
+class TokenBucket:
+    """
+    Bucket holding up to capacity units, refilled continuously at capacity per minute.
+
+    The level may go negative when a call used more than it reserved; the debt
+    is paid back by the refill before anything else is admitted.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def seconds_until(self, amount: float) -> float:
+        """Time until amount units are available (amount is capped at the capacity)."""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+class RateLimitScheduler:
+    """
+    Process-wide admission control for OpenAI calls.
+
+    Each call asks for one request and its estimated number of tokens. Calls
+    wait in a priority queue (FIFO within the same priority) until the
+    requests-per-minute and tokens-per-minute buckets can cover them and fewer
+    than max_in_flight calls are running. Only the head of the queue may be
+    admitted, so a large call is not starved by a stream of small ones.
+
+    Args:
+        rpm: Requests per minute budget
+        tpm: Tokens per minute budget
+        max_in_flight: Maximum number of calls running at the same time
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self, tokens: int, priority: int = DEFAULT_PRIORITY) -> float:
+        """
+        Block until a call of the given estimated size may be sent.
+
+        Returns:
+            The time spent waiting in seconds
+        """
+        start = time.monotonic()
+        entry = (priority, next(self._seq))
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    delay = self._admission_delay(entry, tokens)
+                    if delay == 0:
+                        break
+                    self._condition.wait(timeout=delay)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._requests.level -= 1
+            self._tokens.level -= tokens
+            self._in_flight += 1
+            waited = time.monotonic() - start
+            self.admitted += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            # The next caller in line may be admissible as well
+            self._condition.notify_all()
+        return waited
+
+    def _admission_delay(self, entry: tuple, tokens: int) -> Optional[float]:
+        """Return 0 if entry can be admitted now, else how long to wait (None: until notified)."""
+        if self._queue[0] != entry or self._in_flight >= self.max_in_flight:
+            return None
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return max(self._requests.seconds_until(1), self._tokens.seconds_until(tokens))
+
+    def release(self, reserved_tokens: int, used_tokens: Optional[int] = None) -> None:
+        """
+        Mark a call as finished and correct the token bucket with the actual usage.
+
+        Args:
+            reserved_tokens: The estimate passed to acquire
+            used_tokens: Tokens reported by the API (None keeps the estimate)
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                self._tokens.level = min(self._tokens.capacity, self._tokens.level + reserved_tokens - used_tokens)
+            self._condition.notify_all()
+
+    def pause(self, seconds: Optional[float] = None) -> None:
+        """Stop admitting calls for a while after the API answered 429."""
+        with self._condition:
+            self.rate_limited += 1
+            until = time.monotonic() + (seconds if seconds is not None else RATE_LIMIT_PAUSE_SECONDS)
+            self._paused_until = max(self._paused_until, until)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: int, priority: int = DEFAULT_PRIORITY):
+        """
+        Hold an admission for the duration of the block.
+
+        The block receives a dict; set its "used_tokens" to the tokens the API
+        reported so the bucket is corrected when the block exits.
+        """
+        waited = self.acquire(tokens, priority)
+        usage: Dict[str, Any] = {"wait_seconds": waited, "used_tokens": None}
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage["used_tokens"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            return {
+                "rpm_limit": int(self._requests.capacity),
+                "tpm_limit": int(self._tokens.capacity),
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "requests_available": round(self._requests.level, 1),
+                "tokens_available": round(self._tokens.level),
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "admitted": self.admitted,
+                "rate_limited": self.rate_limited,
+                "average_wait_seconds": round(self.total_wait_seconds / self.admitted, 3) if self.admitted else None,
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+def call_priority(call_type: str) -> int:
+    return CALL_PRIORITIES.get(call_type, DEFAULT_PRIORITY)
+
+
+openai_scheduler = RateLimitScheduler(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, MAX_CONCURRENT_LLM_CALLS)
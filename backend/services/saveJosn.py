@@ -1,7 +1,7 @@
 import os
 import json
 
-from services.extractContent import extractContent
+from services.extractionPool import extract_in_order
 
 UPLOAD_DIR = "temp_uploads"
 
@@ -9,7 +9,10 @@ def write_extracted_content_json(folder_name):
     """
     Walks through the directory tree starting at UPLOAD_DIR/folder_name and writes a nested JSON structure
     directly to a file named 'result.json' in that folder. For each file, it extracts its content using extractContent()
-    and writes an entry with "file" and "content".
+    (through the persistent extraction cache) and writes an entry with "file" and "content".
+    
+    Files are extracted in parallel by the extraction process pool, a few files ahead of the writer;
+    entries are still written in sorted directory order as soon as they are ready.
     
     The JSON structure looks like:
     {
@@ -27,6 +30,17 @@ def write_extracted_content_json(folder_name):
     result_file = os.path.join(base_folder, "result.json")
     
     with open(result_file, "w", encoding="utf-8") as fp:
+        def list_files(dir_path):
+            # Files in the order write_directory visits them
+            for item in sorted(os.listdir(dir_path)):
+                full_path = os.path.join(dir_path, item)
+                if os.path.isdir(full_path):
+                    yield from list_files(full_path)
+                elif os.path.isfile(full_path):
+                    yield full_path
+        
+        contents = extract_in_order(list(list_files(base_folder)))
+        
         def write_directory(dir_path, fp):
             # Write the start of a directory object.
             dirname = os.path.basename(dir_path)
@@ -47,7 +61,7 @@ def write_extracted_content_json(folder_name):
                     write_directory(full_path, fp)
                 elif os.path.isfile(full_path):
                     # Extract content from the file and write its JSON representation.
-                    content = extractContent(full_path)  # Assumes extractContent is implemented
+                    content = next(contents)
                     file_obj = {"file": item, "content": content}
                     fp.write(json.dumps(file_obj))
             fp.write("]}")
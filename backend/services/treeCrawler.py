@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+import services.files as files
+from services.files import DETAIL_FIELDS, file_details, normalize_path
+from services.httpClient import RETRY_STATUS_CODES, new_async_client, origin_of
+from services.progress import emit
+
+CRAWL_MAX_IN_FLIGHT = int(os.getenv("CRAWL_MAX_IN_FLIGHT", "16"))  # Concurrent read requests per crawl
+CRAWL_RETRIES = 3  # Retries of a read after a transient error
+CRAWL_BACKOFF_SECONDS = 0.5  # First retry delay, doubled on every attempt
+
+
+class CrawlError(Exception):
+    """Raised when a directory cannot be read from the file server."""
+
+
+async def read_directory(client: httpx.AsyncClient, path: str, slots: asyncio.Semaphore) -> List[Dict]:
+    """
+    Send one "read" request for path, retrying transient failures with backoff.
+
+    Returns:
+        The items of the directory as sent by the file server
+    """
+    payload = {"action": "read", "path": path, "showHiddenItems": False, "data": []}
+    delay = CRAWL_BACKOFF_SECONDS
+    for attempt in range(CRAWL_RETRIES + 1):
+        try:
+            async with slots:
+                response = await client.post(files.fileServer, json=payload)
+            if response.status_code in RETRY_STATUS_CODES:
+                raise httpx.HTTPStatusError(
+                    f"File server answered {response.status_code}", request=response.request, response=response
+                )
+            data = json.loads(json.loads(response.text))
+            if "files" not in data:
+                raise CrawlError(f"Could not read {path}: {data.get('error')}")
+            return data["files"]
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if attempt == CRAWL_RETRIES:
+                raise CrawlError(f"Could not read {path} after {attempt + 1} attempts: {str(e)}") from e
+            print(f"Retrying read of {path} in {delay}s: {str(e)}")
+            emit("crawl_retry", counters={"crawl_retries": 1}, path=path, error=str(e))
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+def _record_details(path: str, items: List[Dict]) -> None:
+    for item in items:
+        if item["isFile"]:
+            file_details[normalize_path(path + "/" + item["name"])] = {
+                field: item.get(field) for field in DETAIL_FIELDS
+            }
+
+
+def _build_tree(path: str, listings: Dict[str, List[Dict]]) -> List:
+    # Same shape and order as traverse_path: files as names, directories as
+    # {"directory": ..., "files": [...]}, empty directories left out
+    tree = []
+    for item in listings.get(path, []):
+        if item["isFile"]:
+            tree.append(item["name"])
+        else:
+            subtree = _build_tree(normalize_path(path + "/" + item["name"]), listings)
+            if subtree:
+                tree.append({"directory": item["name"], "files": subtree})
+    return tree
+
+
+def _new_client(max_in_flight: int) -> httpx.AsyncClient:
+    return new_async_client(max_in_flight, origin=origin_of(files.fileServer))
+
+
+async def crawl_tree_async(path: str = "/", max_in_flight: int = CRAWL_MAX_IN_FLIGHT) -> List:
+    """
+    Crawl the file server breadth-first from path with up to max_in_flight
+    concurrent read requests. Every directory is read as soon as its parent
+    has been listed, instead of one directory at a time.
+
+    Returns:
+        The tree below path, in the same shape as traverse_path(path)
+    """
+    root = normalize_path(path)
+    listings: Dict[str, List[Dict]] = {}
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async with _new_client(max_in_flight) as client:
+        async def visit(directory: str) -> None:
+            items = await read_directory(client, directory, slots)
+            listings[directory] = items
+            _record_details(directory, items)
+            emit("directory_crawled", counters={"directories_crawled": 1}, path=directory)
+            children = [normalize_path(directory + "/" + item["name"]) for item in items if not item["isFile"]]
+            await asyncio.gather(*(visit(child) for child in children))
+
+        await visit(root)
+
+    return _build_tree(root, listings)
+
+
+async def find_directory_async(directory_name: str, max_in_flight: int = CRAWL_MAX_IN_FLIGHT,
+                               skip: Optional[Set[str]] = None) -> Optional[str]:
+    """
+    Search the file server for a directory, reading each level concurrently.
+
+    The result is the match a depth-first walk in listing order finds first,
+    as with get_directory_list on the full tree, not merely the shallowest
+    one. Once a match is known, only directories listed before it are read
+    further, since only they can hold an earlier match.
+
+    Args:
+        directory_name: Name of the directory to find
+        max_in_flight: Concurrent read requests
+        skip: Paths not to return or search below (e.g. matches found empty)
+
+    Returns:
+        The path of the directory, or None if it does not exist
+    """
+    skip = skip or set()
+    slots = asyncio.Semaphore(max_in_flight)
+    found = None  # (position in the depth-first walk, path) of the earliest match so far
+    async with _new_client(max_in_flight) as client:
+        level = [((), "/")]
+        while level:
+            listings = await asyncio.gather(*(read_directory(client, path, slots) for _, path in level))
+            next_level = []
+            for (position, path), items in zip(level, listings):
+                directories = [item for item in items if not item["isFile"]]
+                for index, item in enumerate(directories):
+                    child = (position + (index,), normalize_path(path + "/" + item["name"]))
+                    if child[1] in skip:
+                        continue
+                    if item["name"] == directory_name and (found is None or child[0] < found[0]):
+                        found = child
+                    next_level.append(child)
+            # Directories after the match in the walk (its own subtree included) cannot hold an earlier one
+            level = [child for child in next_level if found is None or child[0] < found[0]]
+    return found[1] if found is not None else None
+
+
+def crawl_tree(path: str = "/") -> List:
+    """
+    Blocking wrapper around crawl_tree_async for worker threads.
+
+    Must not be called from a thread running an event loop.
+    """
+    return asyncio.run(crawl_tree_async(path))
+
+
+def find_directory(directory_name: str, skip: Optional[Set[str]] = None) -> Optional[str]:
+    """Blocking wrapper around find_directory_async for worker threads."""
+    return asyncio.run(find_directory_async(directory_name, skip=skip))
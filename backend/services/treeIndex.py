@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from services.files import fetchFiles, get_directory_list, listFiles, normalize_path, traverse_path
+from services.progress import emit
+from services.treeCrawler import crawl_tree
+from services.treeCrawler import find_directory as search_directory
+
+TREE_INDEX_TTL_SECONDS = int(os.getenv("TREE_INDEX_TTL_SECONDS", "60"))  # How long crawled trees are reused
+TARGETED_CRAWL = True  # Crawl only the requested directory instead of the whole file server
+ASYNC_CRAWL = True  # Read directories concurrently (services/treeCrawler.py) instead of one by one
+
+
+class TreeIndex:
+    """
+    Cache of the file server tree.
+
+    Holds the full tree (as returned by listFiles), the subtrees of single
+    directories crawled in targeted mode, and the paths directories were
+    found at, so that a directory can be found again without searching.
+    Everything expires after ttl seconds and can be invalidated explicitly
+    (e.g. after files were uploaded). Concurrent requests for the same tree
+    share one crawl.
+
+    Args:
+        ttl: Seconds a crawled tree stays valid
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+        self._full_tree: Optional[tuple] = None  # (fetched_at, tree)
+        self._subtrees: Dict[str, tuple] = {}  # directory name -> (fetched_at, [directory item])
+        self._paths: Dict[str, str] = {}  # directory name -> path a depth-first walk finds it at
+        self._lock = threading.Lock()
+        self._crawl_locks: Dict[str, threading.Lock] = {}
+
+    def _fresh(self, entry: Optional[tuple]) -> bool:
+        return entry is not None and time.time() - entry[0] < self.ttl
+
+    def _crawl_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._crawl_locks.setdefault(key, threading.Lock())
+
+    def _remember_paths(self, tree: List, current_path: str = "") -> None:
+        for item in tree:
+            if isinstance(item, dict):
+                path = f"{current_path}/{item['directory']}"
+                self._paths.setdefault(item["directory"], path)
+                self._remember_paths(item.get("files", []), path)
+
+    def get_tree(self, refresh: bool = False) -> List:
+        """Return the full file server tree, crawling it only when the cached one expired."""
+        with self._crawl_lock("/"):
+            if not refresh and self._fresh(self._full_tree):
+                self.hits += 1
+                emit("tree_cache_hit", counters={"tree_cache_hits": 1}, scope="full")
+                return self._full_tree[1]
+            self.misses += 1
+            emit("tree_cache_miss", counters={"tree_cache_misses": 1}, scope="full")
+            tree = crawl_tree("/") if ASYNC_CRAWL else listFiles()
+            with self._lock:
+                self._full_tree = (time.time(), tree)
+                self._paths = {}
+                self._remember_paths(tree)
+            return tree
+
+    def find_directory(self, directory_name: str, skip: Optional[Set[str]] = None) -> Optional[str]:
+        """
+        Return the path of a directory: the match a depth-first walk of the
+        file server in listing order finds first, as get_directory_list would
+        on the full tree. Known paths are reused.
+
+        Args:
+            directory_name: Name of the directory to find
+            skip: Paths not to return or search below (e.g. matches found empty)
+        """
+        skip = skip or set()
+        with self._lock:
+            known = self._paths.get(directory_name)
+        if known is not None and known not in skip:
+            return known
+
+        if ASYNC_CRAWL:
+            return search_directory(directory_name, skip=skip)
+
+        stack = ["/"]
+        while stack:
+            path = stack.pop()
+            if path != "/" and path.rsplit("/", 1)[-1] == directory_name:
+                return path
+            items = fetchFiles(path)
+            self.reads += 1
+            children = [normalize_path(path + "/" + item["name"]) for item in items if not item["isFile"]]
+            # Reversed so that the first directory of the listing is visited next
+            stack.extend(child for child in reversed(children) if child not in skip)
+        return None
+
+    def get_directory(self, directory_name: str, refresh: bool = False) -> Optional[List]:
+        """
+        Return the subtree of one directory in the shape of get_directory_list:
+        [{"directory": name, "files": [...]}], or None if it does not exist.
+
+        A fresh full tree is used when there is one. Otherwise only the path
+        to the directory is searched and only its subtree is crawled.
+        """
+        if not refresh and self._fresh(self._full_tree):
+            self.hits += 1
+            emit("tree_cache_hit", counters={"tree_cache_hits": 1}, scope="full")
+            return get_directory_list(self._full_tree[1], directory_name)
+
+        with self._crawl_lock(directory_name):
+            if not refresh and self._fresh(self._subtrees.get(directory_name)):
+                self.hits += 1
+                emit("tree_cache_hit", counters={"tree_cache_hits": 1}, scope="directory")
+                return self._subtrees[directory_name][1]
+
+            self.misses += 1
+            emit("tree_cache_miss", counters={"tree_cache_misses": 1}, scope="directory")
+            crawl = crawl_tree if ASYNC_CRAWL else traverse_path
+            skip = set()
+            while True:
+                path = self.find_directory(directory_name, skip)
+                if path is None:
+                    return None
+                try:
+                    subtree = crawl(path)
+                except Exception as e:
+                    # The directory may have moved since its path was remembered
+                    print(f"Could not crawl {path}, searching for '{directory_name}' again: {str(e)}")
+                    with self._lock:
+                        self._paths.pop(directory_name, None)
+                    path = self.find_directory(directory_name, skip)
+                    if path is None:
+                        return None
+                    subtree = crawl(path)
+                if subtree:
+                    break
+                # Empty directories are left out of the tree, like in a full crawl,
+                # so a later directory of the same name with files is the match
+                skip.add(path)
+                with self._lock:
+                    self._paths.pop(directory_name, None)
+
+            target_dir = [{"directory": directory_name, "files": subtree}]
+            with self._lock:
+                self._paths[directory_name] = path
+                self._subtrees[directory_name] = (time.time(), target_dir)
+            return target_dir
+
+    def invalidate(self, directory_name: Optional[str] = None) -> None:
+        """Forget the cached tree of one directory, or everything when no name is given."""
+        with self._lock:
+            if directory_name is None:
+                self._full_tree = None
+                self._subtrees.clear()
+                self._paths.clear()
+                return
+            self._subtrees.pop(directory_name, None)
+            self._paths.pop(directory_name, None)
+            # The full tree contains the directory as well
+            self._full_tree = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": "tree_index",
+                "ttl_seconds": self.ttl,
+                "full_tree_age_seconds": round(time.time() - self._full_tree[0], 1) if self._full_tree else None,
+                "directories_cached": len(self._subtrees),
+                "paths_known": len(self._paths),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "search_reads": self.reads,
+            }
+
+
+tree_index = TreeIndex(TREE_INDEX_TTL_SECONDS)